@@ -28,7 +28,10 @@ objs = list([obj["objectId"] for obj in c.last_event.metadata["objects"]])
 #c.step({"action":"InitialRandomSpawn", "excludedReceptacles":["Microwave", "Pan", "Chair", "Plate", "Fridge", "Cabinet", "Drawer", "GarbageCan"]})
 # c.step({"action":"InitialRandomSpawn", "excludedReceptacles":["Cabinet", "Drawer", "GarbageCan"]})
 
-action_queue = []
+action_queue = ActionDispatcher()
+
+# camera frames are written or encoded in the background (options from execute_plan.py)
+frame_sink = open_frame_sink(**frame_sink_options)
 
 task_over = False
 
@@ -46,139 +49,161 @@ def exec_actions():
         shutil.rmtree (x)
     
     # create new folders to save the images from the agents
+    # (the frames go straight to the videos when they are streamed)
     for i in range(no_robot):
         folder_name = "agent_" + str(i+1)
         folder_path = os.path.dirname(__file__) + "/" + folder_name
-        if not os.path.exists(folder_path):
+        if not os.path.exists(folder_path) and not frame_sink.streams:
             os.makedirs(folder_path)
     
     # create folder to store the top view images
     folder_name = "top_view"
     folder_path = os.path.dirname(__file__) + "/" + folder_name
-    if not os.path.exists(folder_path):
+    if not os.path.exists(folder_path) and not frame_sink.streams:
         os.makedirs(folder_path)
     
-    img_counter = 0
-    
-    while not task_over:
-        if len(action_queue) > 0:
-            try:
-                act = action_queue[0]
-                if act['action'] == 'ObjectNavExpertAction':
-                    multi_agent_event = c.step(dict(action=act['action'], position=act['position'], agentId=act['agent_id']))
-                    next_action = multi_agent_event.metadata['actionReturn']
+    # frames shown when the first action fails before stepping the simulator
+    multi_agent_event = c.last_event
+    while True:
+        # blocks until a skill queues an action, None once the dispatcher is shut down
+        act = action_queue.get()
+        if act is None:
+            break
+        error = None
+        try:
+            if act['action'] == 'ObjectNavExpertAction':
+                multi_agent_event = c.step(dict(action=act['action'], position=act['position'], agentId=act['agent_id']))
+                next_action = multi_agent_event.metadata['actionReturn']
 
-                    if next_action != None:
-                        multi_agent_event = c.step(action=next_action, agentId=act['agent_id'], forceAction=True)
+                if next_action != None:
+                    multi_agent_event = c.step(action=next_action, agentId=act['agent_id'], forceAction=True)
+            
+            elif act['action'] == 'MoveAhead':
+                multi_agent_event = c.step(action="MoveAhead", agentId=act['agent_id'])
                 
-                elif act['action'] == 'MoveAhead':
-                    multi_agent_event = c.step(action="MoveAhead", agentId=act['agent_id'])
+            elif act['action'] == 'MoveBack':
+                multi_agent_event = c.step(action="MoveBack", agentId=act['agent_id'])
                     
-                elif act['action'] == 'MoveBack':
-                    multi_agent_event = c.step(action="MoveBack", agentId=act['agent_id'])
-                        
-                elif act['action'] == 'RotateLeft':
-                    multi_agent_event = c.step(action="RotateLeft", degrees=act['degrees'], agentId=act['agent_id'])
-                    
-                elif act['action'] == 'RotateRight':
-                    multi_agent_event = c.step(action="RotateRight", degrees=act['degrees'], agentId=act['agent_id'])
-                    
-                elif act['action'] == 'PickupObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="PickupObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
+            elif act['action'] == 'RotateLeft':
+                multi_agent_event = c.step(action="RotateLeft", degrees=act['degrees'], agentId=act['agent_id'])
+                
+            elif act['action'] == 'RotateRight':
+                multi_agent_event = c.step(action="RotateRight", degrees=act['degrees'], agentId=act['agent_id'])
+                
+            elif act['action'] == 'PickupObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="PickupObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
  
-                elif act['action'] == 'PutObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="PutObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
+            elif act['action'] == 'PutObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="PutObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
  
-                elif act['action'] == 'ToggleObjectOn':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="ToggleObjectOn", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
+            elif act['action'] == 'ToggleObjectOn':
+                total_exec += 1
+                multi_agent_event = c.step(action="ToggleObjectOn", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
+            
+            elif act['action'] == 'ToggleObjectOff':
+                total_exec += 1
+                multi_agent_event = c.step(action="ToggleObjectOff", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
                 
-                elif act['action'] == 'ToggleObjectOff':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="ToggleObjectOff", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
-                    
-                elif act['action'] == 'OpenObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="OpenObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
- 
-                    
-                elif act['action'] == 'CloseObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="CloseObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
-                        
-                elif act['action'] == 'SliceObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="SliceObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
-                        
-                elif act['action'] == 'ThrowObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="ThrowObject", moveMagnitude=7, agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
-                        
-                elif act['action'] == 'BreakObject':
-                    total_exec += 1
-                    multi_agent_event = c.step(action="BreakObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
-                    if multi_agent_event.metadata['errorMessage'] != "":
-                        print (multi_agent_event.metadata['errorMessage'])
-                    else:
-                        success_exec += 1
+            elif act['action'] == 'OpenObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="OpenObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
  
                 
-                elif act['action'] == 'Done':
-                    multi_agent_event = c.step(action="Done")
+            elif act['action'] == 'CloseObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="CloseObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
                     
+            elif act['action'] == 'SliceObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="SliceObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
                     
-            except Exception as e:
-                print (e)
+            elif act['action'] == 'ThrowObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="ThrowObject", moveMagnitude=7, agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
+                    
+            elif act['action'] == 'BreakObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="BreakObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
+ 
+            
+            elif act['action'] == 'CleanObject':
+                total_exec += 1
+                multi_agent_event = c.step(action="CleanObject", objectId=act['objectId'], agentId=act['agent_id'], forceAction=True)
+                if multi_agent_event.metadata['errorMessage'] != "":
+                    print (multi_agent_event.metadata['errorMessage'])
+                else:
+                    success_exec += 1
+            
+            elif act['action'] == 'Done':
+                multi_agent_event = c.step(action="Done")
                 
-            for i,e in enumerate(multi_agent_event.events):
-                cv2.imshow('agent%s' % i, e.cv2img)
-                # 영상 생성을 위해 이미지 저장 (나중에 영상으로 변환됨)
-                f_name = os.path.dirname(__file__) + "/agent_" + str(i+1) + "/img_" + str(img_counter).zfill(5) + ".png"
-                cv2.imwrite(f_name, e.cv2img)
-            top_view_rgb = cv2.cvtColor(c.last_event.events[0].third_party_camera_frames[-1], cv2.COLOR_BGR2RGB)
-            cv2.imshow('Top View', top_view_rgb)
-            # 영상 생성을 위해 이미지 저장 (나중에 영상으로 변환됨)
-            f_name = os.path.dirname(__file__) + "/top_view/img_" + str(img_counter).zfill(5) + ".png"
-            cv2.imwrite(f_name, top_view_rgb)
-            if cv2.waitKey(25) & 0xFF == ord('q'):
-                break
+            else:
+                # never sent to the simulator, the skill must not take it as done
+                error = f"unknown action {act['action']}"
+                print (error)
+                
+        except Exception as e:
+            print (e)
+            error = str(e)
+        # the skill waiting on this action can go on
+        act['future'].set_result(action_result(act, c.last_event, error))
             
-            img_counter += 1    
-            action_queue.pop(0)
+        for i,e in enumerate(multi_agent_event.events):
+            cv2.imshow('agent%s' % i, e.cv2img)
+            # 영상 생성을 위해 이미지 저장 (나중에 영상으로 변환됨)
+            frame_sink.put(os.path.dirname(__file__) + "/agent_" + str(i+1), e.cv2img)
+        top_view_rgb = cv2.cvtColor(c.last_event.events[0].third_party_camera_frames[-1], cv2.COLOR_BGR2RGB)
+        cv2.imshow('Top View', top_view_rgb)
+        # 영상 생성을 위해 이미지 저장 (나중에 영상으로 변환됨)
+        frame_sink.put(os.path.dirname(__file__) + "/top_view", top_view_rgb)
+        if cv2.waitKey(25) & 0xFF == ord('q'):
+            break
+    
+    # stopped with 'q': the actions still queued are not executed
+    action_queue.close()
+    while True:
+        act = action_queue.get()
+        if act is None:
+            break
+        act['future'].set_result(action_result(act, None, "not executed, the executor was stopped"))
        
 actions_thread = threading.Thread(target=exec_actions)
 actions_thread.start()
@@ -229,6 +254,7 @@ def GoToObject(robots, dest_obj):
     # at least one robot is far away from the goal
     
     while all(d > goal_thresh for d in dist_goals):
+        steps = []
         for ia, robot in enumerate(robots):
             robot_name = robot['name']
             agent_id = int(robot_name[-1]) - 1
@@ -255,14 +281,16 @@ def GoToObject(robots, dest_obj):
                 count_since_update[ia] = 0
                 
             if count_since_update[ia] < 8:
-                action_queue.append({'action':'ObjectNavExpertAction', 'position':dict(x=crp[ia][0], y=crp[ia][1], z=crp[ia][2]), 'agent_id':agent_id})
+                steps.append(action_queue.append({'action':'ObjectNavExpertAction', 'position':dict(x=crp[ia][0], y=crp[ia][1], z=crp[ia][2]), 'agent_id':agent_id}))
             else:    
                 #updating goal
                 clost_node_location[ia] += 1
                 count_since_update[ia] = 0
                 crp = closest_node(dest_obj_pos, reachable_positions, no_agents, clost_node_location)
-    
-            time.sleep(0.5)
+        
+        # the poses are read again once the robots made their step
+        for step in steps:
+            wait_action(step)
 
     # align the robot once goal is reached
     # compute angle between robot heading and object
@@ -285,9 +313,9 @@ def GoToObject(robots, dest_obj):
     rot_angle = angle - robot_location['rotation']
     
     if rot_angle > 0:
-        action_queue.append({'action':'RotateRight', 'degrees':abs(rot_angle), 'agent_id':agent_id})
+        wait_action(action_queue.append({'action':'RotateRight', 'degrees':abs(rot_angle), 'agent_id':agent_id}))
     else:
-        action_queue.append({'action':'RotateLeft', 'degrees':abs(rot_angle), 'agent_id':agent_id})
+        wait_action(action_queue.append({'action':'RotateLeft', 'degrees':abs(rot_angle), 'agent_id':agent_id}))
         
     print ("Reached: ", dest_obj)
     if dest_obj == "Cabinet" or dest_obj == "Fridge" or dest_obj == "CounterTop":
@@ -318,8 +346,8 @@ def PickupObject(robots, pick_obj):
         # GoToObject(robot, pick_obj_id)
         # time.sleep(1)
         print ("Picking Up ", pick_obj_id, dest_obj_center)
-        action_queue.append({'action':'PickupObject', 'objectId':pick_obj_id, 'agent_id':agent_id})
-        time.sleep(1)
+        future = action_queue.append({'action':'PickupObject', 'objectId':pick_obj_id, 'agent_id':agent_id})
+        wait_action(future)
     
 def PutObject(robot, put_obj, recp):
     print(f"Putting: {put_obj} into {recp}")
@@ -352,8 +380,8 @@ def PutObject(robot, put_obj, recp):
     #     recp_obj_id = recp_id
     # GoToObject(robot, recp_obj_id)
     # time.sleep(1)
-    action_queue.append({'action':'PutObject', 'objectId':recp_obj_id, 'agent_id':agent_id})
-    time.sleep(1)
+    future = action_queue.append({'action':'PutObject', 'objectId':recp_obj_id, 'agent_id':agent_id})
+    wait_action(future)
          
 def SwitchOn(robot, sw_obj):
     print ("Switching On: ", sw_obj)
@@ -369,8 +397,8 @@ def SwitchOn(robot, sw_obj):
                 sw_obj_id = obj
                 GoToObject(robot, sw_obj_id)
                 # time.sleep(1)
-                action_queue.append({'action':'ToggleObjectOn', 'objectId':sw_obj_id, 'agent_id':agent_id})
-                time.sleep(0.1)
+                future = action_queue.append({'action':'ToggleObjectOn', 'objectId':sw_obj_id, 'agent_id':agent_id})
+                wait_action(future)
     
     # all objects apart from Stove Burner
     else:
@@ -380,9 +408,8 @@ def SwitchOn(robot, sw_obj):
                 sw_obj_id = obj
                 break # find the first instance
         GoToObject(robot, sw_obj_id)
-        time.sleep(1)
-        action_queue.append({'action':'ToggleObjectOn', 'objectId':sw_obj_id, 'agent_id':agent_id})
-        time.sleep(1)            
+        future = action_queue.append({'action':'ToggleObjectOn', 'objectId':sw_obj_id, 'agent_id':agent_id})
+        wait_action(future)
         
 def SwitchOff(robot, sw_obj):
     print ("Switching Off: ", sw_obj)
@@ -396,8 +423,8 @@ def SwitchOff(robot, sw_obj):
             match = re.match(sw_obj, obj)
             if match is not None:
                 sw_obj_id = obj
-                action_queue.append({'action':'ToggleObjectOff', 'objectId':sw_obj_id, 'agent_id':agent_id})
-                time.sleep(0.1)
+                future = action_queue.append({'action':'ToggleObjectOff', 'objectId':sw_obj_id, 'agent_id':agent_id})
+                wait_action(future)
     
     # all objects apart from Stove Burner
     else:
@@ -407,9 +434,8 @@ def SwitchOff(robot, sw_obj):
                 sw_obj_id = obj
                 break # find the first instance
         GoToObject(robot, sw_obj_id)
-        time.sleep(1)
-        action_queue.append({'action':'ToggleObjectOff', 'objectId':sw_obj_id, 'agent_id':agent_id})
-        time.sleep(1)      
+        future = action_queue.append({'action':'ToggleObjectOff', 'objectId':sw_obj_id, 'agent_id':agent_id})
+        wait_action(future)
     
 def OpenObject(robot, sw_obj):
     robot_name = robot['name']
@@ -427,9 +453,8 @@ def OpenObject(robot, sw_obj):
         sw_obj_id = recp_id
     
     GoToObject(robot, sw_obj_id)
-    time.sleep(1)
-    action_queue.append({'action':'OpenObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
-    time.sleep(1)
+    future = action_queue.append({'action':'OpenObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
+    wait_action(future)
     
 def CloseObject(robot, sw_obj):
     robot_name = robot['name']
@@ -447,13 +472,12 @@ def CloseObject(robot, sw_obj):
         sw_obj_id = recp_id
         
     GoToObject(robot, sw_obj_id)
-    time.sleep(1)
     
-    action_queue.append({'action':'CloseObject', 'objectId':sw_obj_id, 'agent_id':agent_id}) 
+    future = action_queue.append({'action':'CloseObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
     
     if recp_id is not None:
         recp_id = None
-    time.sleep(1)
+    wait_action(future)
     
 def BreakObject(robot, sw_obj):
     robot_name = robot['name']
@@ -466,9 +490,8 @@ def BreakObject(robot, sw_obj):
             sw_obj_id = obj
             break # find the first instance
     GoToObject(robot, sw_obj_id)
-    time.sleep(1)
-    action_queue.append({'action':'BreakObject', 'objectId':sw_obj_id, 'agent_id':agent_id}) 
-    time.sleep(1)
+    future = action_queue.append({'action':'BreakObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
+    wait_action(future)
     
 def SliceObject(robot, sw_obj):
     print ("Slicing: ", sw_obj)
@@ -482,9 +505,8 @@ def SliceObject(robot, sw_obj):
             sw_obj_id = obj
             break # find the first instance
     GoToObject(robot, sw_obj_id)
-    time.sleep(1)
-    action_queue.append({'action':'SliceObject', 'objectId':sw_obj_id, 'agent_id':agent_id})      
-    time.sleep(1)
+    future = action_queue.append({'action':'SliceObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
+    wait_action(future)
     
 def CleanObject(robot, sw_obj):
     robot_name = robot['name']
@@ -497,9 +519,8 @@ def CleanObject(robot, sw_obj):
             sw_obj_id = obj
             break # find the first instance
     GoToObject(robot, sw_obj_id)
-    time.sleep(1)
-    action_queue.append({'action':'CleanObject', 'objectId':sw_obj_id, 'agent_id':agent_id}) 
-    time.sleep(1)
+    future = action_queue.append({'action':'CleanObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
+    wait_action(future)
     
 def ThrowObject(robot, sw_obj):
     robot_name = robot['name']
@@ -512,5 +533,5 @@ def ThrowObject(robot, sw_obj):
             sw_obj_id = obj
             break # find the first instance
     
-    action_queue.append({'action':'ThrowObject', 'objectId':sw_obj_id, 'agent_id':agent_id}) 
-    time.sleep(1)
\ No newline at end of file
+    future = action_queue.append({'action':'ThrowObject', 'objectId':sw_obj_id, 'agent_id':agent_id})
+    wait_action(future)
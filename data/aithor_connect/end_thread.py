@@ -2,11 +2,16 @@
 for i in range(25):
     action_queue.append({'action':'Done'})
     action_queue.append({'action':'Done'})
-    action_queue.append({'action':'Done'})
-    time.sleep(0.1)
+    wait_action(action_queue.append({'action':'Done'}))
 
 task_over = True
-time.sleep(5)
+# let the dispatcher finish the queued actions, then stop it
+action_queue.close()
+actions_thread.join()
+print (action_queue.summary())
+# wait for the frames still being written (and the videos when they are streamed)
+frame_sink.close()
+print (frame_sink.summary())
 
 
 exec = 0.0 if total_exec == 0 else float(success_exec) / float(total_exec) # revise
@@ -94,4 +99,5 @@ if tc == 1 and ru == 1:
 
 print (f"SR:{sr}, TC:{tc}, GCR:{gcr}, Exec:{exec}, RU:{ru}")
 
-generate_video()
\ No newline at end of file
+if not frame_sink.streams:
+    generate_video(frame_sink.ext)
\ No newline at end of file
@@ -4,6 +4,7 @@ import shutil
 import subprocess
 import time
 import threading
+import concurrent.futures
 import cv2
 import numpy as np
 from ai2thor.controller import Controller
@@ -26,7 +27,306 @@ def closest_node(node, nodes, no_robot, clost_node_location):
 def distance_pts(p1: Tuple[float, float, float], p2: Tuple[float, float, float]):
     return ((p1[0] - p2[0]) ** 2 + (p1[2] - p2[2]) ** 2) ** 0.5
 
-def generate_video():
+def action_result(act, event, error=None):
+    # what a skill waiting on the future of an action gets back once it is executed
+    agent_id = act.get('agent_id')
+    if event is None:
+        metadata = {}
+    elif agent_id is not None and agent_id < len(event.events):
+        metadata = event.events[agent_id].metadata
+    else:
+        metadata = event.metadata
+    if error is None:
+        error = metadata.get('errorMessage', "")
+    return {'action': act['action'], 'success': not error, 'errorMessage': error, 'metadata': metadata}
+
+# seconds a skill waits for one of its actions before giving up on it
+ACTION_TIMEOUT = 60
+
+def wait_action(future, timeout=ACTION_TIMEOUT):
+    # result of an action queued with action_queue.append(), once the simulator has run it
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        return {'action': None, 'success': False, 'errorMessage': f"no result after {timeout}s", 'metadata': {}}
+
+# actions that only move a robot around, served after the interactions of other robots
+NAV_ACTIONS = {'ObjectNavExpertAction', 'MoveAhead', 'MoveBack', 'RotateLeft', 'RotateRight', 'Done'}
+
+class ActionDispatcher:
+    # thread-safe action queues, one per robot (agent_id), plus one for actions of no robot.
+    # Skill threads append actions and wait on the returned future, the exec_actions thread
+    # blocks on a condition variable until one arrives, so an idle queue costs no CPU. The next action is taken
+    # round-robin over the robots with queued actions, keeping the order of each robot:
+    #   - 'priority' (default): a robot whose next action is an interaction (pickup, put,
+    #     toggle...) goes before robots that are navigating, but a robot is never passed
+    #     over more than max_skips times in a row, which bounds its waiting time
+    #   - 'round_robin': strict alternation between robots
+    def __init__(self, policy='priority', max_skips=4):
+        self.policy = policy
+        self.max_skips = max_skips
+        self._queues = {}
+        self._order = []
+        self._next = 0
+        self._skips = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.enqueued = 0
+        self.dispatched = {}
+        self.max_wait = {}
+        self.dropped = 0
+        self.max_depth = 0
+        self._depth_total = 0
+        self.idle_time = 0.0
+
+    def append(self, action):
+        # queues the action, returns a Future resolved with its action_result() once executed
+        agent = action.get('agent_id')
+        future = action['future'] = concurrent.futures.Future()
+        with self._cond:
+            if self._closed:
+                # skill threads still running after the end of the plan
+                self.dropped += 1
+                future.set_result(action_result(action, None, "not executed, the plan is over"))
+                return future
+            if agent not in self._queues:
+                self._queues[agent] = deque()
+                self._order.append(agent)
+                self._skips[agent] = 0
+            self._queues[agent].append((time.time(), action))
+            self._size += 1
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._size)
+            self._depth_total += self._size
+            self._cond.notify()
+        return future
+
+    def _pick(self):
+        # robot whose next action is dispatched
+        n = len(self._order)
+        waiting = [self._order[(self._next + k) % n] for k in range(n)]
+        waiting = [a for a in waiting if self._queues[a]]
+        starving = [a for a in waiting if self._skips[a] >= self.max_skips]
+        if self.policy == 'round_robin' or starving:
+            chosen = (starving or waiting)[0]
+        else:
+            interacting = [a for a in waiting if self._queues[a][0][1]['action'] not in NAV_ACTIONS]
+            chosen = (interacting or waiting)[0]
+        for a in waiting:
+            self._skips[a] = 0 if a == chosen else self._skips[a] + 1
+        self._next = (self._order.index(chosen) + 1) % n
+        return chosen
+
+    def get(self):
+        # next action, waiting for one; None once the dispatcher is closed and drained
+        with self._cond:
+            start = time.time()
+            while not self._size and not self._closed:
+                self._cond.wait()
+            self.idle_time += time.time() - start
+            if not self._size:
+                return None
+            agent = self._pick()
+            queued, action = self._queues[agent].popleft()
+            self._size -= 1
+            self.dispatched[agent] = self.dispatched.get(agent, 0) + 1
+            self.max_wait[agent] = max(self.max_wait.get(agent, 0.0), time.time() - queued)
+            return action
+
+    def close(self):
+        # no more actions are accepted, get() returns None once the queues are empty
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return self._size
+
+    def summary(self):
+        mean_depth = self._depth_total / self.enqueued if self.enqueued else 0.0
+        agents = ", ".join(f"{'robot' + str(a + 1) if a is not None else 'other'} {self.dispatched.get(a, 0)} "
+                           f"(max wait {self.max_wait.get(a, 0.0):.1f}s)" for a in self._order)
+        return (f"Action queue ({self.policy}): {sum(self.dispatched.values())}/{self.enqueued} actions dispatched, "
+                f"{self.dropped} dropped after shutdown, depth mean {mean_depth:.1f} max {self.max_depth}, "
+                f"dispatcher idle {self.idle_time:.1f}s\n  {agents}")
+
+class FrameSink:
+    # writes the camera frames from background threads, so stepping the simulator does not
+    # wait for image compression and the disk (cv2.imwrite releases the GIL). Frames are
+    # numbered per folder (img_00000.png, ...) when they are accepted, so the sequences
+    # stay without gaps for ffmpeg. At most max_pending frames wait to be written; when the
+    # writers fall behind, policy decides:
+    #   - 'block': put() waits for room, every frame is saved
+    #   - 'drop': the new frame is dropped, the video skips it
+    # compression is the PNG level (0-9, OpenCV's default 3) or the JPEG quality (0-100)
+    def __init__(self, workers=2, max_pending=32, fmt='png', compression=None, policy='block'):
+        if fmt not in ('png', 'jpg'):
+            raise ValueError(f"unknown frame format {fmt}")
+        if policy not in ('block', 'drop'):
+            raise ValueError(f"unknown frame policy {policy}")
+        self.ext = fmt
+        # False: image sequences for generate_video(), True: videos written during the episode
+        self.streams = False
+        if fmt == 'png':
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, 3 if compression is None else compression]
+        else:
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, 95 if compression is None else compression]
+        self.policy = policy
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._counters = {}
+        self._cond = threading.Condition()
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.write_time = 0.0
+        self.blocked_time = 0.0
+        self._writers = [threading.Thread(target=self._write, daemon=True) for _ in range(workers)]
+        for writer in self._writers:
+            writer.start()
+
+    def put(self, folder, frame):
+        # queues a frame for the next image of folder, False when it is dropped
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                if self.policy == 'drop':
+                    self.dropped += 1
+                    return False
+                start = time.time()
+                while len(self._pending) >= self.max_pending:
+                    self._cond.wait()
+                self.blocked_time += time.time() - start
+            n = self._counters.get(folder, 0)
+            self._counters[folder] = n + 1
+            self._pending.append((folder, n, frame))
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._cond.notify_all()
+            return True
+
+    def _write(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                folder, n, frame = self._pending.popleft()
+                # room for a blocked put()
+                self._cond.notify_all()
+            start = time.time()
+            try:
+                ok = self._save(folder, n, frame)
+            except Exception as e:
+                print (f"cannot write frame {n} of {folder}: {e}")
+                ok = False
+            with self._cond:
+                self.write_time += time.time() - start
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+
+    def _save(self, folder, n, frame):
+        return cv2.imwrite(f"{folder}/img_{str(n).zfill(5)}.{self.ext}", frame, self.params)
+
+    def close(self):
+        # waits for the queued frames to be written
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for writer in self._writers:
+            writer.join()
+
+    def summary(self):
+        mean_write = self.write_time / self.written if self.written else 0.0
+        return (f"Frames ({self.ext}, {len(self._writers)} writers, {self.policy}): {self.written} written, "
+                f"{self.dropped} dropped, {self.failed} failed, queue max {self.max_depth}/{self.max_pending}, "
+                f"{1000 * mean_write:.0f}ms per frame, simulator blocked {self.blocked_time:.1f}s")
+
+class VideoSink(FrameSink):
+    # streams the raw frames of each view into its own ffmpeg process, writing
+    # video_<view>.mp4 next to the view's folder during the episode instead of image files
+    # encoded again by generate_video() at the end. A frame identical to the previous one of
+    # its view (the Done actions at the end of the plan) is skipped. A single writer keeps
+    # the frames of each view in order; the ffmpeg processes encode in parallel.
+    # compression is the x264 CRF (0-51, ffmpeg's default 23)
+    def __init__(self, max_pending=32, compression=None, policy='block', frame_rate=5, **unused):
+        self.frame_rate = frame_rate
+        self.crf = 23 if compression is None else compression
+        self._encoders = {}
+        self._last = {}
+        self.skipped = 0
+        super().__init__(workers=1, max_pending=max_pending, policy=policy)
+        self.ext = 'mp4'
+        self.streams = True
+
+    def _encoder(self, folder, frame):
+        # ffmpeg reading raw BGR frames on its stdin, started with the first frame of the view
+        height, width = frame.shape[:2]
+        video = os.path.dirname(folder) + "/video_" + os.path.basename(folder) + ".mp4"
+        command_set = ['ffmpeg', '-y', '-loglevel', 'error',
+                       '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{width}x{height}",
+                       '-framerate', str(self.frame_rate), '-i', '-',
+                       '-pix_fmt', 'yuv420p', '-crf', str(self.crf), video]
+        return subprocess.Popen(command_set, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+
+    def _save(self, folder, n, frame):
+        last = self._last.get(folder)
+        if last is not None and np.array_equal(last, frame):
+            self.skipped += 1
+            return True
+        if folder not in self._encoders:
+            self._encoders[folder] = self._encoder(folder, frame)
+        encoder = self._encoders[folder]
+        if encoder.stdin.closed:
+            return False
+        try:
+            encoder.stdin.write(np.ascontiguousarray(frame).tobytes())
+        except BrokenPipeError:
+            # ffmpeg stopped, the other frames of the view are lost
+            print (f"ffmpeg of {os.path.basename(folder)} stopped reading frames")
+            encoder.stdin.close()
+            return False
+        self._last[folder] = frame
+        return True
+
+    def close(self):
+        # the videos are complete once ffmpeg has read the end of its input
+        super().close()
+        for folder, encoder in self._encoders.items():
+            if not encoder.stdin.closed:
+                encoder.stdin.close()
+            if encoder.wait() != 0:
+                print (f"video of {os.path.basename(folder)} failed, ffmpeg exited with {encoder.returncode}")
+            else:
+                print (f"video_{os.path.basename(folder)}.mp4 생성 완료")
+
+    def summary(self):
+        mean_write = self.write_time / self.written if self.written else 0.0
+        return (f"Frames (mp4, {len(self._encoders)} videos, {self.policy}): {self.written - self.skipped} encoded, "
+                f"{self.skipped} duplicates skipped, {self.dropped} dropped, {self.failed} failed, "
+                f"queue max {self.max_depth}/{self.max_pending}, {1000 * mean_write:.0f}ms per frame, "
+                f"simulator blocked {self.blocked_time:.1f}s")
+
+def open_frame_sink(fmt='png', **options):
+    # VideoSink for fmt 'mp4' when ffmpeg is installed, FrameSink writing images otherwise
+    if fmt == 'mp4':
+        if shutil.which('ffmpeg') is not None:
+            return VideoSink(**options)
+        print("   ffmpeg가 설치되지 않았습니다. 비디오 대신 PNG 이미지를 저장합니다.")
+        fmt = 'png'
+        # the compression was given as a CRF
+        options['compression'] = None
+    return FrameSink(fmt=fmt, **options)
+
+def generate_video(ext='png'):
     frame_rate = 5
     cur_path = os.path.dirname(__file__) + "/*/"
     
@@ -45,7 +345,7 @@ def generate_video():
             print("The input path: {} you specified does not exist.".format(imgs_folder))
         else:
             command_set = ['ffmpeg', '-y', '-i',  # -y: 덮어쓰기 자동 허용
-                          '{}/img_%05d.png'.format(imgs_folder), 
+                          '{}/img_%05d.{}'.format(imgs_folder, ext), 
                           '-framerate', str(frame_rate),
                           '-pix_fmt', 'yuv420p',
                           '{}/video_{}.mp4'.format(os.path.dirname(__file__), view)]
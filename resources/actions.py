@@ -3,4 +3,5 @@ ai2thor_actions = ["GoToObject <robot><object>", "OpenObject <robot><object>", "
                    "SwitchOff <robot><object>", "CleanObject <robot><object>", "PickupObject <robot><object>", 
                    "PutObject <robot><object><receptacleObject>", "DropHandObject <robot><object>", 
                    "ThrowObject <robot><object>", "PushObject <robot><object>", "PullObject <robot><object>"]
+ai2thor_skills = [a.split(' ')[0] for a in ai2thor_actions]
 ai2thor_actions = ', '.join(ai2thor_actions)
@@ -0,0 +1,96 @@
+import json
+
+from resources.actions import ai2thor_skills
+
+
+# Robot type of the fleets. Skills are kept as a bitmask over the skills of
+# resources/actions.py, so "does this robot / team have these skills" is one AND,
+# and robots are immutable: a task renames its copy with renamed() instead of
+# editing the shared definition.
+# A fleet file is a JSON list of robots in the format of resources/robots.py:
+#   [{"name": "robot1", "skills": ["GoToObject", "PickupObject"], "mass": 100}, ...]
+
+SKILL_BITS = {skill: 1 << i for i, skill in enumerate(ai2thor_skills)}
+
+
+def skill_mask(skills):
+    mask = 0
+    for skill in skills:
+        if skill not in SKILL_BITS:
+            raise ValueError(f"unknown skill {skill}, the skills are listed in resources/actions.py")
+        mask |= SKILL_BITS[skill]
+    return mask
+
+
+def skill_names(mask):
+    return [skill for skill, bit in SKILL_BITS.items() if mask & bit]
+
+
+class Robot:
+    __slots__ = ('name', 'skill_mask', 'mass_capacity', 'mass_key')
+
+    def __init__(self, name, skills, mass_capacity=float('inf'), mass_key='mass_capacity'):
+        # mass_key: 'mass' or 'mass_capacity', the key the robot is written with in prompts and logs
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'skill_mask', skills if isinstance(skills, int) else skill_mask(skills))
+        object.__setattr__(self, 'mass_capacity', mass_capacity)
+        object.__setattr__(self, 'mass_key', mass_key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Robot is immutable, use renamed() to rename {self.name}")
+
+    def __delattr__(self, name):
+        raise AttributeError("Robot is immutable")
+
+    @classmethod
+    def from_dict(cls, robot):
+        mass_key = 'mass_capacity' if 'mass_capacity' in robot else 'mass'
+        return cls(robot['name'], robot['skills'], robot.get(mass_key, float('inf')), mass_key)
+
+    @property
+    def skills(self):
+        return skill_names(self.skill_mask)
+
+    def has_skills(self, mask):
+        return self.skill_mask & mask == mask
+
+    def renamed(self, name):
+        return Robot(name, self.skill_mask, self.mass_capacity, self.mass_key)
+
+    def as_dict(self):
+        # the dict format of resources/robots.py, used in the prompts and the executable plans
+        return {'name': self.name, 'skills': self.skills, self.mass_key: self.mass_capacity}
+
+    def __eq__(self, other):
+        return isinstance(other, Robot) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        return (self.name, self.skill_mask, self.mass_capacity, self.mass_key)
+
+    def __repr__(self):
+        return f"Robot({self.name!r}, {self.skills!r}, {self.mass_key}={self.mass_capacity!r})"
+
+
+def load_fleet(path):
+    with open(path, "r") as f:
+        return [Robot.from_dict(r) for r in json.load(f)]
+
+
+def coverage_matrix(fleet, requirements):
+    # robots x subtasks feasibility: matrix[r][s] is True when robot r can do subtask s alone.
+    # requirements: one (skill mask, mass) per subtask. Each skill is a bitset over the whole
+    # fleet, so a subtask is one AND per required skill whatever the number of robots.
+    with_skill = {bit: sum(1 << i for i, r in enumerate(fleet) if r.skill_mask & bit) for bit in SKILL_BITS.values()}
+    columns = []
+    for mask, mass in requirements:
+        capable = (1 << len(fleet)) - 1
+        for bit, robots in with_skill.items():
+            if mask & bit:
+                capable &= robots
+        if mass > 0:
+            capable &= sum(1 << i for i, r in enumerate(fleet) if r.mass_capacity >= mass)
+        columns.append(capable)
+    return [[bool(column >> r & 1) for column in columns] for r in range(len(fleet))]
@@ -1,3 +1,5 @@
+from resources.fleet import Robot
+
 # List of robots with different configurations 
 
 # ALL SKILLS - INF MASS (robot1,robot2,robot3,robot4)
@@ -103,5 +105,5 @@ robot26 = {'name': 'robot26',  'skills': ['GoToObject','SliceObject', 'PickupObj
 # Only T
 robot27 = {'name': 'robot27',  'skills': ['GoToObject','BreakObject','ThrowObject'], 'mass' : 100}
 
-robots = [robot1, robot2, robot3, robot4, robot5, robot6, robot7, robot8, robot9, robot10,
-          robot11, robot12, robot13, robot14, robot15, robot16, robot17, robot18, robot19, robot20, robot21,robot22, robot23, robot24, robot25, robot26, robot27, robot28]
\ No newline at end of file
+robots = [Robot.from_dict(r) for r in [robot1, robot2, robot3, robot4, robot5, robot6, robot7, robot8, robot9, robot10,
+          robot11, robot12, robot13, robot14, robot15, robot16, robot17, robot18, robot19, robot20, robot21,robot22, robot23, robot24, robot25, robot26, robot27, robot28]]
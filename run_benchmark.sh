@@ -39,35 +39,21 @@ generate_all() {
     echo "=========================================="
     echo ""
 
-    TOTAL_SUCCESS=0
-    TOTAL_FAIL=0
-
-    for FLOOR in "${FLOORPLANS[@]}"; do
-        echo "=========================================="
-        echo "Running FloorPlan ${FLOOR}..."
-        echo "=========================================="
-
-        # CHANGED: 로컬 GPT_VERSION 사용
-        python3 scripts/run_llm.py --floor-plan ${FLOOR} --gpt-version ${GPT_VERSION_LOCAL} --log-results 1
-        EXIT_CODE=$?
-
-        if [ $EXIT_CODE -eq 0 ]; then
-            echo -e "${GREEN}✓ FloorPlan ${FLOOR} completed successfully${NC}"
-            TOTAL_SUCCESS=$((TOTAL_SUCCESS + 1))
-        else
-            echo -e "${RED}✗ FloorPlan ${FLOOR} failed with exit code ${EXIT_CODE}${NC}"
-            TOTAL_FAIL=$((TOTAL_FAIL + 1))
-        fi
-
-        echo ""
-        sleep 3
-    done
+    # all floor plans are generated in one process (shared prompt loading and rate limits),
+    # run_llm.py prints the per-floor-plan summary and exits non-zero if any task failed
+    set +e
+    python3 scripts/run_llm.py --floor-plan ${FLOORPLANS[@]} --gpt-version ${GPT_VERSION_LOCAL} --log-results 1 --build-catalog
+    EXIT_CODE=$?
+    set -e
 
     echo "=========================================="
     echo "CODE GENERATION COMPLETE"
     echo "=========================================="
-    echo "Success: ${TOTAL_SUCCESS}/${#FLOORPLANS[@]}"
-    echo "Failed:  ${TOTAL_FAIL}/${#FLOORPLANS[@]}"
+    if [ $EXIT_CODE -eq 0 ]; then
+        echo -e "${GREEN}✓ All FloorPlans completed successfully${NC}"
+    else
+        echo -e "${RED}✗ Some tasks failed (exit code ${EXIT_CODE}), see the summary above${NC}"
+    fi
     echo "=========================================="
 }
 
@@ -153,8 +139,15 @@ full_benchmark() {
         TOTAL_TASKS=$((TOTAL_TASKS + task_count))
     done
 
-    # 비용 추정(예시 유지)
-    if [ "$GPT_VERSION_LOCAL" = "gpt-4" ]; then
+    # 비용 추정: 이전 실행의 telemetry가 있으면 측정된 작업당 비용, 없으면 예시 값
+    COST_PER_TASK=""
+    if [ -d "logs" ]; then
+        COST_PER_TASK=$(python3 scripts/llm_telemetry.py logs --cost-per-task "$GPT_VERSION_LOCAL" 2>/dev/null)
+    fi
+    if [ -n "$COST_PER_TASK" ]; then
+        ESTIMATED_COST=$(echo "scale=2; $TOTAL_TASKS * $COST_PER_TASK" | bc)
+        echo "Cost per task measured from logs/*/telemetry.jsonl: \$$COST_PER_TASK"
+    elif [ "$GPT_VERSION_LOCAL" = "gpt-4" ]; then
         ESTIMATED_COST=$(echo "scale=2; $TOTAL_TASKS * 0.04" | bc)
     else
         ESTIMATED_COST=$(echo "scale=2; $TOTAL_TASKS * 0.005" | bc)
@@ -225,18 +218,25 @@ single_with_retry() {
     for i in $(seq 1 $MAX_RETRIES); do
         echo "Attempt $i/$MAX_RETRIES at $(date)"
 
+        # retries reuse the stages that already succeeded (logs/.checkpoints) and ask
+        # the LLM again for the failed one instead of replaying its cached response
+        RESUME_FLAG=""
+        if [ $i -gt 1 ]; then
+            RESUME_FLAG="--resume --no-cache"
+        fi
+
         set +e
         if [ -n "$TASK_CONTAINS_LOCAL" ]; then
             python3 scripts/run_llm.py \
                 --floor-plan ${FLOOR_PLAN} \
                 --gpt-version ${GPT_VERSION_LOCAL} \
-                --log-results 1 \
-                --task-contains "$TASK_CONTAINS_LOCAL"
+                --log-results 1 --build-catalog \
+                --task-contains "$TASK_CONTAINS_LOCAL" $RESUME_FLAG
         else
             python3 scripts/run_llm.py \
                 --floor-plan ${FLOOR_PLAN} \
                 --gpt-version ${GPT_VERSION_LOCAL} \
-                --log-results 1
+                --log-results 1 --build-catalog $RESUME_FLAG
         fi
         EXIT_CODE=$?
         set -e
@@ -285,13 +285,20 @@ single_with_retry_index() {
     for i in $(seq 1 $MAX_RETRIES); do
         echo "Attempt $i/$MAX_RETRIES at $(date)"
 
+        # retries reuse the stages that already succeeded (logs/.checkpoints) and ask
+        # the LLM again for the failed one instead of replaying its cached response
+        RESUME_FLAG=""
+        if [ $i -gt 1 ]; then
+            RESUME_FLAG="--resume --no-cache"
+        fi
+
         # CHANGED: set -e 때문에 실패 시 즉시 종료되는 것 방지
         set +e
         python3 scripts/run_llm.py \
             --floor-plan ${FLOOR_PLAN} \
             --gpt-version ${GPT_VERSION_LOCAL} \
-            --log-results 1 \
-            --task-index "$TASK_INDEX_LOCAL"
+            --log-results 1 --build-catalog \
+            --task-index "$TASK_INDEX_LOCAL" $RESUME_FLAG
         EXIT_CODE=$?
         set -e
 
@@ -0,0 +1,199 @@
+import ast
+import re
+from itertools import combinations
+
+from resources.fleet import Robot, coverage_matrix, skill_mask
+
+
+# Deterministic replacement for the LLM allocation stage (--allocation solver).
+# The subtasks, their required skills and the objects they carry are read from the
+# decomposed plan; each subtask gets a minimum-size coalition of robots that together
+# have every required skill and enough mass capacity for the heaviest object carried
+# (exact search over coalitions of increasing size, fleets per task are small).
+# Subtasks that the plan runs in parallel get disjoint coalitions when possible, and with
+# the travel costs of the floor plan (travel_costs.py) the coalition that finishes its
+# subtasks soonest, counting the distance each robot walks, is preferred.
+# The result is written as the "# SOLUTION" text the code generation stage consumes.
+
+SUBTASK_LINE = re.compile(r"^#\s*SubTask\s+(\d+):\s*(.*?)\s*\(Skills Required:\s*(.*?)\)", re.MULTILINE)
+SUBTASK_COMMENT = re.compile(r"SubTask\s+(\d+)")
+# skills whose first object argument is carried by the robot
+CARRY_SKILLS = {'PickupObject', 'PutObject', 'ThrowObject'}
+
+
+class AllocationError(Exception):
+    pass
+
+
+def object_mass(name, objects):
+    masses = [o['mass'] for o in objects if o['name'] == name]
+    if not masses:
+        masses = [o['mass'] for o in objects if o['name'].startswith(name)]
+    return max(masses, default=0.0)
+
+
+def skill_calls(fn, skills):
+    # (skill, first string argument) of the skill calls in a function body
+    calls = []
+    for node in ast.walk(fn):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in skills:
+            args = [a.value for a in node.args if isinstance(a, ast.Constant) and isinstance(a.value, str)]
+            calls.append((node.func.id, args[0] if args else None))
+    return calls
+
+
+def parallel_pairs(tree):
+    # pairs of functions the plan runs at the same time, from the thread start/join order
+    threads, running, pairs = {}, set(), set()
+    for stmt in tree.body:
+        for node in ast.walk(stmt):
+            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Call):
+                call = node.value
+                if isinstance(call.func, ast.Attribute) and call.func.attr == 'Thread':
+                    target = {k.arg: k.value for k in call.keywords}.get('target')
+                    if isinstance(target, ast.Name) and isinstance(node.targets[0], ast.Name):
+                        threads[node.targets[0].id] = target.id
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                    and isinstance(node.func.value, ast.Name) and node.func.value.id in threads:
+                fn = threads[node.func.value.id]
+                if node.func.attr == 'start':
+                    pairs.update(tuple(sorted((fn, other))) for other in running if other != fn)
+                    running.add(fn)
+                elif node.func.attr == 'join':
+                    running.discard(fn)
+    return pairs
+
+
+def parse_subtasks(plan, objects, skills):
+    # [{'number', 'description', 'function', 'skills', 'carried', 'mass', 'route'}] in plan order
+    described = {int(n): (desc.strip().rstrip('.'), [s.strip() for s in req.split(',') if s.strip()])
+                 for n, desc, req in SUBTASK_LINE.findall(plan)}
+    try:
+        tree = ast.parse(plan)
+    except SyntaxError as e:
+        raise AllocationError(f"decomposed plan does not parse: {e.msg} (line {e.lineno})")
+    functions = [n for n in tree.body if isinstance(n, ast.FunctionDef)]
+    if not functions:
+        raise AllocationError("decomposed plan defines no subtask function")
+
+    subtasks = []
+    for i, fn in enumerate(functions, 1):
+        # the "# 0: SubTask k: ..." comment of the function names its subtask, plan order otherwise
+        source = ast.get_source_segment(plan, fn) or ""
+        match = SUBTASK_COMMENT.search(source)
+        number = int(match.group(1)) if match else i
+        description, required = described.get(number, (fn.name.replace('_', ' '), []))
+        calls = skill_calls(fn, skills)
+        carried = sorted({obj for skill, obj in calls if skill in CARRY_SKILLS and obj})
+        subtasks.append({
+            'number': number,
+            'description': description,
+            'function': fn.name,
+            'skills': sorted(set(s for s in required if s in skills) | {skill for skill, _ in calls}),
+            'carried': carried,
+            'mass': max((object_mass(o, objects) for o in carried), default=0.0),
+            'route': [obj for skill, obj in calls if skill == 'GoToObject' and obj],
+        })
+    return subtasks, parallel_pairs(tree)
+
+
+def feasible(team, fleet, mask, mass):
+    team_mask = 0
+    for i in team:
+        team_mask |= fleet[i].skill_mask
+    return team_mask & mask == mask and sum(fleet[i].mass_capacity for i in team) >= mass
+
+
+def minimum_coalitions(subtask, fleet, alone):
+    # every coalition of the smallest feasible size, in a deterministic order;
+    # alone: robots that can do the subtask on their own (column of the coverage matrix)
+    if any(alone):
+        return [(i,) for i, ok in enumerate(alone) if ok]
+    mask = skill_mask(subtask['skills'])
+    for size in range(2, len(fleet) + 1):
+        teams = [team for team in combinations(range(len(fleet)), size)
+                 if feasible(team, fleet, mask, subtask['mass'])]
+        if teams:
+            return teams
+    raise AllocationError(f"no team of the {len(fleet)} robots can perform SubTask {subtask['number']} "
+                          f"(skills {', '.join(subtask['skills'])}, mass {subtask['mass']})")
+
+
+def finish_time(team, subtask, loads, last, travel):
+    # distance walked by the busiest robot of the team once it has also done this subtask
+    if travel is None or not subtask['route']:
+        return max(loads[i] for i in team)
+    route = travel.route_length(subtask['route'])
+    return max(loads[i] + (travel.distance(last[i], subtask['route'][0]) or 0.0) + route for i in team)
+
+
+def choose_teams(subtasks, candidates, parallel, robot_count, travel=None):
+    # prefer coalitions disjoint from those of the subtasks running at the same time,
+    # then the one finishing first; returns the teams and the estimated makespan in meters
+    chosen = {}
+    loads = [0.0] * robot_count
+    last = [None] * robot_count
+    for subtask in subtasks:
+        fn = subtask['function']
+        busy = set()
+        for other, team in chosen.items():
+            if tuple(sorted((fn, other))) in parallel:
+                busy |= set(team)
+        free = [team for team in candidates[fn] if not busy & set(team)]
+        team = min(free or candidates[fn], key=lambda team: finish_time(team, subtask, loads, last, travel))
+        finish = finish_time(team, subtask, loads, last, travel)
+        for i in team:
+            loads[i] = finish
+            if subtask['route']:
+                last[i] = subtask['route'][-1]
+        chosen[fn] = team
+    return chosen, max(loads, default=0.0)
+
+
+def robots_phrase(team):
+    numbers = [str(i + 1) for i in team]
+    if len(numbers) == 1:
+        return f"Robot {numbers[0]}"
+    return f"team of Robots {', '.join(numbers[:-1])} and {numbers[-1]}"
+
+
+class Allocation:
+    def __init__(self, subtasks, teams, parallel, makespan=None):
+        self.subtasks = subtasks
+        self.teams = teams
+        self.parallel = parallel
+        # meters walked by the busiest robot, None without travel costs
+        self.makespan = makespan
+
+    def text(self):
+        lines = ["# SOLUTION"]
+        for s in self.subtasks:
+            team = self.teams[s['function']]
+            line = f"# For SubTask {s['number']} '{s['description']}' (function {s['function']}) the skills {', '.join(s['skills'])} are required"
+            if s['carried']:
+                line += f" and the heaviest object carried has mass {s['mass']}"
+            line += "."
+            if len(team) > 1:
+                line += " No single robot has all the skills and mass capacity, this is a gap that needs a team."
+            line += f" The subtask is assigned to {robots_phrase(team)}."
+            lines.append(line)
+        for a, b in sorted(self.parallel):
+            shared = set(self.teams[a]) & set(self.teams[b])
+            if shared:
+                lines.append(f"# {a} and {b} share {robots_phrase(sorted(shared))}, perform them one after the other.")
+            else:
+                lines.append(f"# {a} and {b} are performed in parallel by different robots.")
+        if self.makespan is not None:
+            lines.append(f"# The busiest robot travels about {self.makespan:.1f} m.")
+        return "\n".join(lines)
+
+
+def solve_allocation(plan, robots, objects, skills, travel=None):
+    # travel: TravelCosts of the floor plan, teams are picked on skills and mass alone without it
+    subtasks, parallel = parse_subtasks(plan, objects, skills)
+    fleet = [Robot.from_dict(r) for r in robots]
+    matrix = coverage_matrix(fleet, [(skill_mask(s['skills']), s['mass']) for s in subtasks])
+    candidates = {s['function']: minimum_coalitions(s, fleet, [row[k] for row in matrix])
+                  for k, s in enumerate(subtasks)}
+    teams, makespan = choose_teams(subtasks, candidates, parallel, len(robots), travel)
+    return Allocation(subtasks, teams, parallel, makespan if travel is not None else None)
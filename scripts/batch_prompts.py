@@ -0,0 +1,100 @@
+import re
+import threading
+
+from llm_stream import GenerationAborted, PlanMonitor
+
+
+# Batched task decomposition. Tasks of the same floor plan share the whole decomposition
+# prompt (skills header, objects and training examples) except for the final
+# "# Task Description:" line, so several of them are sent in one request and the
+# response is split back into one delimited section per task. Sections that are missing
+# or do not look like a plan are decomposed again with a single-task request.
+
+SECTION_START = "# === TASK {n} ==="
+SECTION_RE = re.compile(r"^#\s*=+\s*TASK\s+(\d+)\s*=+\s*$", re.MULTILINE)
+# decomposition completion budget per task and for a whole batch
+TASK_MAX_TOKENS = 1300
+BATCH_MAX_TOKENS = 4000
+
+
+def batch_prompt(prompt, tasks):
+    curr_prompt = prompt
+    curr_prompt += f"\n\n# Decompose each of the {len(tasks)} tasks below independently, following the examples above."
+    curr_prompt += f"\n# Start the output of every task with its own header line, exactly:"
+    for n in range(1, len(tasks) + 1):
+        curr_prompt += f"\n# {SECTION_START.format(n=n)}"
+    for n, task in enumerate(tasks, 1):
+        curr_prompt += f"\n\n# Task Description {n}: {task}"
+    return curr_prompt
+
+
+def split_sections(text, count):
+    # {task number: section text} for the sections found in the response
+    sections = {}
+    matches = list(SECTION_RE.finditer(text))
+    for i, match in enumerate(matches):
+        n = int(match.group(1))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        if 1 <= n <= count and n not in sections:
+            sections[n] = strip_fences(text[match.end():end])
+    return sections
+
+
+def strip_fences(text):
+    text = text.strip()
+    if text.startswith("```python"):
+        text = text[len("```python"):].strip()
+    if text.startswith("```"):
+        text = text[3:].strip()
+    if text.endswith("```"):
+        text = text[:-3].strip()
+    return text
+
+
+def valid_section(section, task, skills, example_functions):
+    # a decomposition defines at least one function and passes the stream checks
+    if not section or not re.search(r"^\s*def\s+\w+\s*\(", section, re.MULTILINE):
+        return False
+    monitor = PlanMonitor(task, skills, example_functions)
+    try:
+        monitor.feed(section)
+        monitor.finish()
+    except GenerationAborted:
+        return False
+    return True
+
+
+class BatchDecomposer:
+    # the first task of a batch to need its decomposition sends the batch request,
+    # the other tasks of the batch wait for it and take their section
+    def __init__(self, batches, decompose_batch):
+        self.decompose_batch = decompose_batch
+        self.batch_of = {idx: tuple(batch) for batch in batches for idx in batch}
+        self.locks = {tuple(batch): threading.Lock() for batch in batches}
+        self.results = {}
+        self.requests = 0
+        self.batched = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def get(self, idx):
+        # decomposition of task idx from its batch, None when it has to be decomposed on its own
+        batch = self.batch_of.get(idx)
+        if batch is None:
+            return None
+        with self.locks[batch]:
+            if batch not in self.results:
+                self.results[batch] = self.decompose_batch(batch)
+                with self._lock:
+                    self.requests += 1
+        plan = self.results[batch].get(idx)
+        with self._lock:
+            if plan is None:
+                self.fallbacks += 1
+            else:
+                self.batched += 1
+        return plan
+
+    def summary(self):
+        return (f"Batched decomposition: {self.batched} tasks in {self.requests} requests, "
+                f"{self.fallbacks} tasks fell back to single-task requests")
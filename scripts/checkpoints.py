@@ -0,0 +1,70 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+
+
+# Stage-level checkpoints of run_llm.py. The output of every stage is saved as soon as it
+# returns, in logs/.checkpoints/FloorPlan<N>/<task>/<model>/<stage>.json, together with a
+# hash of the stage inputs (prompt and upstream outputs). With --resume a stage whose
+# inputs did not change is read back instead of calling the API again, and a task whose
+# logs folder was already written is skipped.
+
+DEFAULT_CHECKPOINT_DIR = "logs/.checkpoints"
+
+
+def inputs_key(*inputs):
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def task_slug(task):
+    return re.sub(r"[^\w]+", "_", task).strip("_")[:100]
+
+
+class CheckpointStore:
+    def __init__(self, root=DEFAULT_CHECKPOINT_DIR, resume=False):
+        self.root = Path(root)
+        self.resume = resume
+        self.resumed = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+
+    def _path(self, floor_plan, task, model, stage):
+        return self.root / f"FloorPlan{floor_plan}" / task_slug(task) / model / f"{stage}.json"
+
+    def load(self, floor_plan, task, model, stage, key, valid=None):
+        # output of a previous run of the stage with the same inputs, None without --resume
+        # or when `valid` rejects it
+        if not self.resume:
+            return None
+        path = self._path(floor_plan, task, model, stage)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get('task') != task or entry.get('inputs') != key or entry.get('output') is None:
+            return None
+        if valid is not None and not valid(entry['output']):
+            return None
+        with self._lock:
+            self.resumed += 1
+        return entry['output']
+
+    def save(self, floor_plan, task, model, stage, key, output):
+        path = self._path(floor_plan, task, model, stage)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        entry = {'task': task, 'floor_plan': floor_plan, 'model': model, 'stage': stage,
+                 'inputs': key, 'output': output}
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with self._lock:
+            self.saved += 1
+
+    def summary(self):
+        return f"Checkpoints: {self.resumed} stages resumed, {self.saved} saved to {self.root}"
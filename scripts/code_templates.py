@@ -0,0 +1,223 @@
+import ast
+import re
+
+from allocation_solver import object_mass
+from resources.fleet import Robot
+
+
+# Deterministic code generation (--codegen template), replacing the LLM call of stage 3
+# when the robots were allocated by the solver. The functions of the decomposed plan are
+# kept as they are (comments included) with a robot_list parameter added, and each skill
+# call gets the robots of the subtask team that perform it:
+#   - GoToObject: the robots doing the next actions at that destination
+#   - PickupObject: as many team members able to pick up as the object's mass needs
+#   - other skills: the first team member having the skill
+# Only GoToObject and PickupObject of aithor_connect.py accept several robots.
+# The schedule at the end is rebuilt from the thread start/join order of the plan, and
+# subtasks run in parallel only when their teams do not share a robot.
+
+LIST_SKILLS = {'GoToObject', 'PickupObject'}
+
+
+class TemplateError(Exception):
+    pass
+
+
+def skill_name(node, skills):
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in skills:
+        return node.func.id
+    return None
+
+
+def team_expr(members, team_size):
+    # robot_list expression for team positions `members`
+    if len(members) == team_size and team_size > 1:
+        return "robot_list"
+    if len(members) == 1:
+        return f"robot_list[{members[0]}]"
+    return "[" + ", ".join(f"robot_list[{m}]" for m in members) + "]"
+
+
+def lifters(members, capacities, mass):
+    # first members whose combined capacity carries `mass`, all of them if they cannot
+    total = 0.0
+    for n, m in enumerate(members):
+        total += capacities[m]
+        if total >= mass:
+            return members[:n + 1]
+    return members
+
+
+def bind_calls(calls, team, robots, objects):
+    # {call node: robot_list expression} for the skill calls of a function, in source order
+    capacities = [Robot.from_dict(robots[i]).mass_capacity for i in team]
+
+    def with_skill(skill, node=None):
+        members = [k for k, i in enumerate(team) if skill in robots[i]['skills']]
+        if not members:
+            raise TemplateError(f"no robot of the team has the skill {skill}")
+        if skill == 'PickupObject':
+            obj = node.args[0].value if node.args and isinstance(node.args[0], ast.Constant) else None
+            return lifters(members, capacities, object_mass(obj, objects) if isinstance(obj, str) else 0.0)
+        return members if skill in LIST_SKILLS else members[:1]
+
+    acting = {node: with_skill(skill, node) for skill, node in calls if skill != 'GoToObject'}
+    binding = {}
+    previous = None
+    for n, (skill, node) in enumerate(calls):
+        if skill != 'GoToObject':
+            members = previous = acting[node]
+        else:
+            # robots acting before the next GoToObject, the previous actors after the last one
+            upcoming = set()
+            for later_skill, later in calls[n + 1:]:
+                if later_skill == 'GoToObject':
+                    break
+                upcoming.update(acting[later])
+            members = sorted(upcoming) or previous or with_skill('GoToObject')
+        binding[node] = team_expr(members, len(team))
+    return binding
+
+
+def schedule_waves(tree, functions):
+    # groups of subtask functions run together, in the order of the plan's module code
+    threads, waves, running = {}, [], []
+    for stmt in tree.body:
+        if isinstance(stmt, (ast.FunctionDef, ast.Import, ast.ImportFrom)):
+            continue
+        if isinstance(stmt, ast.Assign) and isinstance(stmt.value, ast.Call) \
+                and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == 'Thread':
+            target = {k.arg: k.value for k in stmt.value.keywords}.get('target')
+            if not (isinstance(target, ast.Name) and target.id in functions and isinstance(stmt.targets[0], ast.Name)):
+                raise TemplateError(f"unsupported thread on line {stmt.lineno}")
+            threads[stmt.targets[0].id] = target.id
+            continue
+        if not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)):
+            raise TemplateError(f"unsupported statement on line {stmt.lineno}")
+        call = stmt.value
+        if isinstance(call.func, ast.Attribute) and isinstance(call.func.value, ast.Name) \
+                and call.func.value.id in threads and call.func.attr in ('start', 'join'):
+            fn = threads[call.func.value.id]
+            if call.func.attr == 'start':
+                running.append(fn)
+            elif running:
+                waves.append(running)
+                running = []
+        elif isinstance(call.func, ast.Name) and call.func.id in functions and not call.args:
+            if running:
+                waves.append(running)
+                running = []
+            waves.append([call.func.id])
+        else:
+            raise TemplateError(f"unsupported call on line {stmt.lineno}")
+    if running:
+        waves.append(running)
+    scheduled = [fn for wave in waves for fn in wave]
+    # subtasks the plan defines but never starts run at the end
+    waves += [[fn] for fn in functions if fn not in scheduled]
+    return waves
+
+
+def split_wave(wave, teams):
+    # sub-waves whose teams are disjoint, keeping the plan order
+    parts = []
+    for fn in wave:
+        for part in parts:
+            if not any(set(teams[fn]) & set(teams[other]) for other in part):
+                part.append(fn)
+                break
+        else:
+            parts.append([fn])
+    return parts
+
+
+def robots_arg(team):
+    return "[" + ", ".join(f"robots[{i}]" for i in team) + "]"
+
+
+def subtask_label(fns, numbers):
+    labels = [f"SubTask {numbers[fn]}" for fn in fns]
+    return labels[0] if len(labels) == 1 else ", ".join(labels[:-1]) + " and " + labels[-1]
+
+
+def schedule_code(waves, teams, numbers):
+    segments = []
+    thread_no = 0
+    for wave in waves:
+        for part in split_wave(wave, teams):
+            label = subtask_label(part, numbers)
+            if len(part) == 1:
+                fn = part[0]
+                segments.append(f"# Execute {label}\n{fn}({robots_arg(teams[fn])})")
+                continue
+            names = [f"task{thread_no + k + 1}_thread" for k in range(len(part))]
+            thread_no += len(part)
+            segments.append(f"# Parallelize {label}\n" + "\n".join(
+                f"{name} = threading.Thread(target={fn}, args=({robots_arg(teams[fn])},))" for name, fn in zip(names, part)))
+            segments.append(f"# Start executing {label} in parallel\n" + "\n".join(f"{name}.start()" for name in names))
+            segments.append(f"# Wait for {label} to finish\n" + "\n".join(f"{name}.join()" for name in names))
+    return "\n\n".join(segments)
+
+
+def char_offset(line, col):
+    # ast column offsets count UTF-8 bytes
+    return len(line.encode('utf-8')[:col].decode('utf-8', errors='ignore'))
+
+
+def render_function(plan_lines, fn, team, robots, objects, skills):
+    calls = sorted(((skill_name(n, skills), n) for n in ast.walk(fn) if skill_name(n, skills)),
+                   key=lambda call: (call[1].lineno, call[1].col_offset))
+    for node in ast.walk(fn):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id[0].isupper() \
+                and node.func.id not in skills:
+            raise TemplateError(f"unknown skill {node.func.id}() in {fn.name}()")
+        if isinstance(node, ast.Name) and node.id in ('robots', 'robot_list'):
+            raise TemplateError(f"{fn.name}() already refers to robots")
+    if fn.args.args or fn.args.vararg or fn.args.kwarg:
+        raise TemplateError(f"{fn.name}() takes arguments")
+    binding = bind_calls(calls, team, robots, objects)
+
+    lines = plan_lines[fn.lineno - 1:fn.end_lineno]
+    # insert the robots right after the opening parenthesis of each call, last ones first
+    for skill, node in sorted(calls, key=lambda c: (c[1].func.end_lineno, c[1].func.end_col_offset), reverse=True):
+        row = node.func.end_lineno - fn.lineno
+        line = lines[row]
+        pos = char_offset(line, node.func.end_col_offset)
+        paren = line.index('(', pos) + 1
+        sep = ", " if node.args or node.keywords else ""
+        lines[row] = line[:paren] + binding[node] + sep + line[paren:]
+
+    header = lines[0]
+    match = re.match(r"(\s*def\s+" + re.escape(fn.name) + r"\s*\()\s*\)", header)
+    if match is None:
+        raise TemplateError(f"cannot parse the definition of {fn.name}()")
+    lines[0] = match.group(1) + "robot_list)" + header[match.end():]
+    indent = re.match(r"\s*", lines[1] if len(lines) > 1 else "    ").group(0) or "    "
+    names = ",".join(robots[i]['name'] for i in team)
+    lines.insert(1, f"{indent}# robot_list = [{names}]")
+    return "\n".join(lines)
+
+
+def generate_allocated_code(plan, allocation, robots, objects, skills, task=""):
+    # code_plan.py for a decomposed plan and the Allocation of allocation_solver.py
+    # robots: the task robots, objects: the scene objects with their mass
+    try:
+        tree = ast.parse(plan)
+    except SyntaxError as e:
+        raise TemplateError(f"decomposed plan does not parse: {e.msg} (line {e.lineno})")
+    functions = [n for n in tree.body if isinstance(n, ast.FunctionDef)]
+    names = [fn.name for fn in functions]
+    if not functions or set(names) != set(allocation.teams):
+        raise TemplateError("the allocation does not cover the functions of the plan")
+    for fn in functions:
+        for node in ast.walk(fn):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in names:
+                raise TemplateError(f"{fn.name}() calls another subtask function")
+
+    plan_lines = plan.splitlines()
+    numbers = {s['function']: s['number'] for s in allocation.subtasks}
+    parts = [render_function(plan_lines, fn, allocation.teams[fn.name], robots, objects, skills) for fn in functions]
+    parts.append(schedule_code(schedule_waves(tree, names), allocation.teams, numbers))
+    if task:
+        parts.append(f"# Task {task} is done")
+    return "\n\n".join(parts) + "\n"
@@ -0,0 +1,100 @@
+import math
+import re
+from collections import Counter
+
+from llm_dispatch import estimate_tokens
+
+
+# Few-shot example selection for the prompts in data/pythonic_plans.
+# Each training file is split into one example per "# Task Description:" block and the
+# examples most similar to the current task are picked with BM25, up to k examples and
+# a token budget, instead of pasting the whole file into every prompt.
+
+EXAMPLE_START = re.compile(r"^#.*Task Description:\s*(.*)$")
+
+STOPWORDS = {'the', 'a', 'an', 'and', 'it', 'in', 'on', 'of', 'to', 'into', 'then', 'from', 'with', 'is',
+             'put', 'place', 'go', 'robot', 'robots', 'subtask', 'task', 'skills', 'required'}
+
+
+def tokenize(text):
+    # words of the text with CamelCase identifiers split, "PickupObject('Fork')" -> pickup, object, fork
+    words = re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+", text)
+    tokens = []
+    for w in words:
+        w = w.lower()
+        if w in STOPWORDS or len(w) < 2:
+            continue
+        tokens.append(w[:-1] if w.endswith('s') and len(w) > 3 else w)
+    return tokens
+
+
+def parse_examples(text):
+    # returns the text before the first example and the list of examples
+    preamble, examples = [], []
+    for line in text.split('\n'):
+        match = EXAMPLE_START.match(line)
+        if match:
+            examples.append({'task': match.group(1).strip(), 'lines': [line]})
+        elif examples:
+            examples[-1]['lines'].append(line)
+        else:
+            preamble.append(line)
+    for example in examples:
+        example['text'] = '\n'.join(example.pop('lines')).strip('\n')
+    return '\n'.join(preamble).strip('\n'), examples
+
+
+def example_function_names(text):
+    # names of the functions defined in the training examples, e.g. wash_fork
+    return set(re.findall(r"^\s*def\s+(\w+)\s*\(", text, re.MULTILINE))
+
+
+class ExampleIndex:
+    def __init__(self, text, k1=1.5, b=0.75):
+        self.text = text
+        self.preamble, self.examples = parse_examples(text)
+        self.k1 = k1
+        self.b = b
+        # the task description counts twice, it describes the example best
+        self.docs = [Counter(tokenize(e['task']) * 2 + tokenize(e['text'])) for e in self.examples]
+        self.doc_len = [sum(d.values()) for d in self.docs]
+        self.avg_len = sum(self.doc_len) / len(self.docs) if self.docs else 0.0
+        df = Counter(t for d in self.docs for t in d)
+        n = len(self.docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def scores(self, query):
+        scores = []
+        terms = set(tokenize(query))
+        for doc, length in zip(self.docs, self.doc_len):
+            score = 0.0
+            for t in terms:
+                tf = doc.get(t, 0)
+                if tf:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / self.avg_len)
+                    score += self.idf[t] * tf * (self.k1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    def select(self, query, k=None, token_budget=None):
+        # indices of the best examples for the query, at least one even over budget
+        scores = self.scores(query)
+        ranked = sorted(range(len(self.examples)), key=lambda i: (-scores[i], i))
+        if k is not None:
+            ranked = ranked[:k]
+        selected, used = [], estimate_tokens(self.preamble)
+        for i in ranked:
+            tokens = estimate_tokens(self.examples[i]['text'])
+            if token_budget is not None and selected and used + tokens > token_budget:
+                continue
+            selected.append(i)
+            used += tokens
+        return sorted(selected)
+
+    def render(self, query, k=None, token_budget=None):
+        # the whole file when no limit is set, otherwise the selected examples in file order
+        if (k is None and token_budget is None) or not self.examples:
+            return self.text
+        parts = [self.preamble] if self.preamble else []
+        parts += [self.examples[i]['text'] for i in self.select(query, k, token_budget)]
+        return '\n\n'.join(parts)
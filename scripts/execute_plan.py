@@ -15,7 +15,7 @@ def append_trans_ctr(allocated_plan):
     print ("No Breaks: ", brk_ctr)
     return brk_ctr
 
-def compile_aithor_exec_file(expt_name):
+def compile_aithor_exec_file(expt_name, frame_sink_options):
     log_path = os.getcwd() + "/logs/" + expt_name
     executable_plan = ""
     
@@ -37,6 +37,8 @@ def compile_aithor_exec_file(expt_name):
     executable_plan += ("no_trans_gt = " + trans)
     max_trans = log_data[11][12:]
     executable_plan += ("max_trans = " + max_trans + "\n")
+    # how the camera frames are written
+    executable_plan += ("frame_sink_options = " + repr(frame_sink_options) + "\n")
     
     # append the ai thoe connector and helper fns
     connector_file = Path(os.getcwd() + "/data/aithor_connect/aithor_connect.py").read_text()
@@ -59,11 +61,21 @@ def compile_aithor_exec_file(expt_name):
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--command", type=str, required=True)
+# mp4: the frames are streamed to one ffmpeg per view during the execution, no images are written
+parser.add_argument("--frame-format", type=str, default="png", choices=['png', 'jpg', 'mp4'])
+# PNG compression level (0-9), JPEG quality (0-100) or x264 CRF (0-51), default when not given
+parser.add_argument("--frame-compression", type=int, default=None)
+parser.add_argument("--frame-writers", type=int, default=2)
+parser.add_argument("--frame-queue", type=int, default=32)
+# when the writers fall behind: 'block' the simulator or 'drop' frames
+parser.add_argument("--frame-policy", type=str, default="block", choices=['block', 'drop'])
 args = parser.parse_args()
 
 expt_name = args.command
 print (expt_name)
-ai_exec_file = compile_aithor_exec_file(expt_name)
+frame_sink_options = dict(workers=args.frame_writers, max_pending=args.frame_queue, fmt=args.frame_format,
+                          compression=args.frame_compression, policy=args.frame_policy)
+ai_exec_file = compile_aithor_exec_file(expt_name, frame_sink_options)
 
 subprocess.run(["python3", ai_exec_file], stdout=sys.stdout, stderr=sys.stderr)
 
@@ -0,0 +1,365 @@
+import ast
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from batch_prompts import SECTION_START
+from llm_cache import request_key
+from prompt_context import COMMON_RECEPTACLES, is_relevant, task_words
+
+
+# Where LM() gets its completions from.
+#   openai    - the OpenAI API (default)
+#   record    - the OpenAI API, every response is also saved to <backend_dir>/<key>.json
+#   replay    - responses saved by "record", no network access; a missing response is an error
+#   synthetic - canned plans built from the task and the scene objects in the prompt
+# The backends mirror openai.Completion.create / openai.ChatCompletion.create, including
+# stream=True, so run_llm.py drives all of them the same way.
+
+BACKENDS = ['openai', 'record', 'replay', 'synthetic']
+DEFAULT_BACKEND_DIR = "llm_recordings"
+# interaction of the synthetic code when no robot of the task can pick and place, in order of preference
+INTERACTION_SKILLS = ['OpenObject', 'SwitchOn', 'SliceObject', 'BreakObject', 'CloseObject', 'SwitchOff']
+
+
+class ReplayMiss(KeyError):
+    pass
+
+
+def request_id(model, params):
+    # same key as the response cache: model, prompt/messages and sampling parameters
+    prompt = params.get('messages', params.get('prompt'))
+    return request_key(model, prompt, params.get('max_tokens'), params.get('temperature'),
+                       params.get('frequency_penalty'), params.get('stop'))
+
+
+def response_text(response, chat):
+    choice = response["choices"][0]
+    return choice["message"]["content"] if chat else choice["text"]
+
+
+def make_response(model, text, chat, finish_reason="stop"):
+    if chat:
+        choice = {"message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}
+    else:
+        choice = {"text": text, "finish_reason": finish_reason}
+    return {"model": model, "choices": [choice]}
+
+
+def stream_chunks(text, chat, finish_reason="stop", chunk_size=16, delay=0.0):
+    # stream=True shape of a complete response, `delay` seconds spread over the chunks
+    pieces = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    for piece in pieces:
+        if delay:
+            time.sleep(delay / len(pieces))
+        if chat:
+            yield {"choices": [{"delta": {"content": piece}, "finish_reason": None}]}
+        else:
+            yield {"choices": [{"text": piece, "finish_reason": None}]}
+    if chat:
+        yield {"choices": [{"delta": {}, "finish_reason": finish_reason}]}
+    else:
+        yield {"choices": [{"text": "", "finish_reason": finish_reason}]}
+
+
+def parse_latency(spec):
+    # replay latency: none, recorded, fixed:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA (seconds)
+    kind, _, values = (spec or "none").partition(':')
+    values = [float(v) for v in values.split(',')] if values else []
+    if kind == 'none':
+        return lambda recorded, rng: 0.0
+    if kind == 'recorded':
+        return lambda recorded, rng: recorded or 0.0
+    if kind == 'fixed' and len(values) == 1:
+        return lambda recorded, rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda recorded, rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda recorded, rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Invalid latency distribution: {spec}")
+
+
+class OpenAIBackend:
+    name = 'openai'
+
+    def completion(self, stage=None, **params):
+        import openai
+        return openai.Completion.create(**params)
+
+    def chat_completion(self, stage=None, **params):
+        import openai
+        return openai.ChatCompletion.create(**params)
+
+    def summary(self):
+        return None
+
+
+class RecordBackend(OpenAIBackend):
+    name = 'record'
+
+    def __init__(self, backend_dir=DEFAULT_BACKEND_DIR):
+        self.backend_dir = Path(backend_dir)
+        self.backend_dir.mkdir(parents=True, exist_ok=True)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def completion(self, stage=None, **params):
+        return self._record(super().completion, stage, params, chat=False)
+
+    def chat_completion(self, stage=None, **params):
+        return self._record(super().chat_completion, stage, params, chat=True)
+
+    def _record(self, create, stage, params, chat):
+        start = time.time()
+        response = create(**params)
+        if not params.get('stream'):
+            self.save(stage, params, response, time.time() - start)
+            return response
+        return self._record_stream(response, stage, params, chat, start)
+
+    def _record_stream(self, chunks, stage, params, chat, start):
+        # saved once the stream is complete, a cancelled stream is not recorded
+        text, finish_reason = "", None
+        for chunk in chunks:
+            choice = chunk["choices"][0]
+            text += (choice["delta"].get("content") if chat else choice.get("text")) or ""
+            finish_reason = choice.get("finish_reason") or finish_reason
+            yield chunk
+        response = make_response(params['model'], text, chat, finish_reason)
+        self.save(stage, params, response, time.time() - start)
+
+    def save(self, stage, params, response, latency):
+        key = request_id(params['model'], params)
+        request = {k: v for k, v in params.items() if k != 'stream'}
+        entry = {'stage': stage, 'request': request, 'response': response, 'latency': latency}
+        path = self.backend_dir / f"{key}.json"
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with open(tmp, 'w') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        with self._lock:
+            self.recorded += 1
+
+    def summary(self):
+        return f"Recorded {self.recorded} responses to {self.backend_dir}"
+
+
+class ReplayBackend:
+    name = 'replay'
+
+    def __init__(self, backend_dir=DEFAULT_BACKEND_DIR, latency="none"):
+        self.backend_dir = Path(backend_dir)
+        self.latency = parse_latency(latency)
+        self.replayed = 0
+        self.simulated_latency = 0.0
+        self._lock = threading.Lock()
+
+    def completion(self, stage=None, **params):
+        return self._replay(params, chat=False)
+
+    def chat_completion(self, stage=None, **params):
+        return self._replay(params, chat=True)
+
+    def _replay(self, params, chat):
+        key = request_id(params['model'], params)
+        path = self.backend_dir / f"{key}.json"
+        if not path.is_file():
+            raise ReplayMiss(f"no recorded response for request {key[:12]} in {self.backend_dir}")
+        with open(path) as f:
+            entry = json.load(f)
+        # seeded per request, the same request always gets the same latency
+        delay = self.latency(entry.get('latency'), random.Random(key))
+        with self._lock:
+            self.replayed += 1
+            self.simulated_latency += delay
+
+        response = entry['response']
+        if params.get('stream'):
+            text = response_text(response, chat)
+            return stream_chunks(text, chat, response["choices"][0].get("finish_reason"), delay=delay)
+        time.sleep(delay)
+        return response
+
+    def summary(self):
+        return f"Replayed {self.replayed} responses from {self.backend_dir} ({self.simulated_latency:.1f}s simulated latency)"
+
+
+class SyntheticBackend:
+    name = 'synthetic'
+
+    def __init__(self, latency="none"):
+        self.latency = parse_latency(latency)
+        self.generated = 0
+        self._lock = threading.Lock()
+
+    def completion(self, stage=None, **params):
+        return self._generate(stage, params['prompt'], params, chat=False)
+
+    def chat_completion(self, stage=None, **params):
+        prompt = "\n".join(m['content'] for m in params['messages'])
+        return self._generate(stage, prompt, params, chat=True)
+
+    def _generate(self, stage, prompt, params, chat):
+        task = prompt_task(prompt)
+        names = prompt_object_names(prompt)
+        obj, receptacle = task_objects(task, names)
+        steps = synthetic_steps(prompt_robots(prompt), obj, receptacle)
+        if stage == 'decompose_batch':
+            tasks = re.findall(r"# Task Description \d+: (.*)", prompt)
+            text = "\n\n".join(SECTION_START.format(n=n) + "\n" + synthetic_plan(t, *task_objects(t, names))
+                               for n, t in enumerate(tasks, 1))
+        elif stage == 'decompose':
+            text = synthetic_plan(task, obj, receptacle)
+        elif stage == 'allocate':
+            text = synthetic_solution(task, steps)
+        else:
+            text = synthetic_code(task, steps)
+
+        key = request_id(params['model'], params)
+        delay = self.latency(None, random.Random(key))
+        with self._lock:
+            self.generated += 1
+        if params.get('stream'):
+            return stream_chunks(text, chat, delay=delay)
+        time.sleep(delay)
+        return make_response(params['model'], text, chat)
+
+    def summary(self):
+        return f"Generated {self.generated} synthetic responses"
+
+
+def prompt_task(prompt):
+    # the current task is the last one described in the prompt, after the training examples
+    for pattern in (r'YOUR CURRENT TASK: "(.*)"', r'# Task Description:\s*(.*)', r'# SubTask 1:\s*(.*?)\s*\(Skills'):
+        found = re.findall(pattern, prompt)
+        if found:
+            return found[-1].strip()
+    return ""
+
+
+def prompt_object_names(prompt):
+    # scene objects, the first objects list of the prompt (examples come after it)
+    match = re.search(r"objects = \[(.*?)\]\n", prompt + "\n")
+    if match is None:
+        return []
+    return list(dict.fromkeys(re.findall(r"'name': '(\w+)'", match.group(1))))
+
+
+def prompt_robots(prompt):
+    # robots of the task, the last robots list of the prompt (examples come before it)
+    start = prompt.rfind("robots = [")
+    if start < 0:
+        return []
+    start += len("robots = ")
+    depth = 0
+    for end in range(start, len(prompt)):
+        depth += {'[': 1, ']': -1}.get(prompt[end], 0)
+        if depth == 0:
+            break
+    try:
+        return ast.literal_eval(prompt[start:end + 1])
+    except (ValueError, SyntaxError):
+        return []
+
+
+def synthetic_steps(robots, obj, receptacle):
+    # [(skill, robot index, arguments)] of the synthetic code, only using skills the robots have:
+    # pick and place by one robot or by a team, otherwise one interaction with the object
+    def having(skill):
+        return [i for i, robot in enumerate(robots) if skill in robot['skills']]
+
+    pickers, placers = having('PickupObject'), having('PutObject')
+    both = [i for i in pickers if i in placers]
+    if both:
+        pickers = placers = both
+    if (pickers and placers) or not robots:
+        p, q = (pickers[0], placers[0]) if robots else (0, 0)
+        return [('GoToObject', p, [obj]), ('PickupObject', p, [obj]),
+                ('GoToObject', q, [receptacle]), ('PutObject', q, [obj, receptacle])]
+    for skill in INTERACTION_SKILLS:
+        if having(skill):
+            i = having(skill)[0]
+            return [('GoToObject', i, [obj]), (skill, i, [obj])]
+    return [('GoToObject', 0, [obj])]
+
+
+def step_skills(steps):
+    return list(dict.fromkeys(skill for skill, _, _ in steps))
+
+
+def task_objects(task, names):
+    # the object the task is about and where to put it
+    words = task_words(task)
+    relevant = [n for n in names if is_relevant(n, task, words)]
+    objs = [n for n in relevant if n not in COMMON_RECEPTACLES]
+    receptacles = [n for n in relevant if n in COMMON_RECEPTACLES]
+    obj = objs[0] if objs else (names[0] if names else 'Apple')
+    if not receptacles:
+        # the counter top when the scene has one (or the objects are unknown), another receptacle
+        # or any other object otherwise
+        receptacles = ([n for n in names if n in COMMON_RECEPTACLES and n != obj]
+                       or [n for n in names if n != obj])
+        if 'CounterTop' in names or not names:
+            receptacles = ['CounterTop']
+    receptacle = receptacles[0] if receptacles else 'CounterTop'
+    return obj, receptacle
+
+
+def synthetic_plan(task, obj, receptacle):
+    return (f"# GENERAL TASK DECOMPOSITION\n"
+            f"# Independent subtasks:\n"
+            f"# SubTask 1: {task} (Skills Required: GoToObject, PickupObject, PutObject)\n"
+            f"# We can perform SubTask 1\n\n"
+            f"# CODE\n"
+            f"def subtask_1():\n"
+            f"    # 0: SubTask 1: {task}\n"
+            f"    GoToObject('{obj}')\n"
+            f"    PickupObject('{obj}')\n"
+            f"    GoToObject('{receptacle}')\n"
+            f"    PutObject('{obj}', '{receptacle}')\n"
+            f"# Perform SubTask 1\n"
+            f"task1_thread = threading.Thread(target=subtask_1)\n"
+            f"task1_thread.start()\n"
+            f"task1_thread.join()\n")
+
+
+def synthetic_solution(task, steps):
+    members = sorted({i for _, i, _ in steps})
+    skills = [f"'{skill}'" for skill in step_skills(steps)]
+    if len(members) == 1:
+        assigned = f"It is assigned to Robot {members[0] + 1}, no team is required."
+    else:
+        assigned = "It is performed by a team of Robots " + " and ".join(str(i + 1) for i in members) + "."
+    return (f"# SOLUTION\n"
+            f"# SubTask 1 '{task}' requires {', '.join(skills[:-1]) + ' and ' if len(skills) > 1 else ''}{skills[-1]}. "
+            + assigned)
+
+
+def synthetic_code(task, steps):
+    members = sorted({i for _, i, _ in steps})
+    names = [f"robot{i + 1}" for i in members]
+    calls = "".join(f"    {skill}(robot_list[{members.index(i)}],{', '.join(repr(a) for a in args)})\n"
+                    for skill, i, args in steps)
+    return (f"def subtask_1(robot_list):\n"
+            f"    # robot_list = [{','.join(names)}]\n"
+            f"    # 0: SubTask 1: {task}\n"
+            + calls +
+            f"# Perform SubTask 1 with {' and '.join(names)}\n"
+            f"subtask_1([{', '.join(f'robots[{i}]' for i in members)}])\n")
+
+
+def make_backend(name, backend_dir=DEFAULT_BACKEND_DIR, latency="none"):
+    if name == 'openai':
+        return OpenAIBackend()
+    if name == 'record':
+        return RecordBackend(backend_dir)
+    if name == 'replay':
+        return ReplayBackend(backend_dir, latency)
+    if name == 'synthetic':
+        return SyntheticBackend(latency)
+    raise ValueError(f"Unknown LLM backend: {name}")
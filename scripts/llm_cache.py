@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+
+# Content-addressed on-disk cache for LLM responses.
+# Every entry lives in <cache_dir>/<key[:2]>/<key>.json where key is the sha256 of the
+# request (model, prompt/messages and sampling parameters). The file mtime is refreshed
+# on every hit, so eviction removes the least recently used entries first once the
+# cache grows over max_bytes. Only deterministic (temperature 0) responses are worth
+# caching, and a response whose plan is rejected later is discarded again, so a retry
+# asks the LLM instead of replaying it.
+
+def request_key(model, prompt, max_tokens, temperature, frequency_penalty, stop):
+    payload = {
+        'model': model,
+        'prompt': prompt,
+        'max_tokens': max_tokens,
+        'temperature': temperature,
+        'frequency_penalty': frequency_penalty,
+        'stop': stop,
+    }
+    payload = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, cache_dir=".llm_cache", max_bytes=512 * 1024 * 1024, enabled=True):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bypassed = 0
+        self.discarded = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._size = 0
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._size = sum(size for _, size, _ in self._entries())
+
+    def _path(self, key):
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _entries(self):
+        # (path, size, last access time) for every stored response
+        entries = []
+        for path in self.cache_dir.glob("*/*.json"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    @contextmanager
+    def tracking(self, bypass=False):
+        # collects the keys of the responses read or written by this thread inside the block,
+        # to discard() them when the output built from them is rejected;
+        # bypass: never answer from the cache inside the block (responses are still stored)
+        outer = getattr(self._local, 'scope', None)
+        scope = {'keys': [], 'bypass': bypass or (outer is not None and outer['bypass'])}
+        self._local.scope = scope
+        try:
+            yield scope['keys']
+        finally:
+            self._local.scope = outer
+            if outer is not None:
+                outer['keys'].extend(scope['keys'])
+
+    def _track(self, key):
+        scope = getattr(self._local, 'scope', None)
+        if scope is not None:
+            scope['keys'].append(key)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        scope = getattr(self._local, 'scope', None)
+        if scope is not None and scope['bypass']:
+            with self._lock:
+                self.bypassed += 1
+            return None
+        path = self._path(key)
+        with self._lock:
+            try:
+                entry = json.loads(path.read_text())
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.misses += 1
+                return None
+            # refresh the access time for LRU eviction
+            now = time.time()
+            os.utime(path, (now, now))
+            self.hits += 1
+        self._track(key)
+        return entry
+
+    def put(self, key, entry):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        data = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            old_size = path.stat().st_size if path.exists() else 0
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(data)
+            os.replace(tmp_path, path)
+            self._size += path.stat().st_size - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+        self._track(key)
+
+    def discard(self, keys):
+        # drop the given responses, e.g. the ones a rejected plan was generated from
+        if not self.enabled:
+            return
+        with self._lock:
+            for key in set(keys):
+                path = self._path(key)
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                self._size -= size
+                self.discarded += 1
+
+    def _evict(self):
+        # drop least recently used entries until the cache fits again
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in self._entries():
+                path.unlink()
+            self._size = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits / total) if total else 0.0,
+            'evictions': self.evictions,
+            'bypassed': self.bypassed,
+            'discarded': self.discarded,
+            'size_bytes': self._size,
+        }
+
+    def summary(self):
+        if not self.enabled:
+            return "LLM cache: disabled"
+        s = self.stats()
+        return (f"LLM cache: {s['hits']} hits, {s['misses']} misses "
+                f"({100 * s['hit_rate']:.1f}% hit rate), {s['bypassed']} bypassed, {s['evictions']} evictions, "
+                f"{s['discarded']} rejected responses discarded, "
+                f"{s['size_bytes'] / (1024 * 1024):.1f} MB on disk")
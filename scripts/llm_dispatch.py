@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Thread-pool dispatch of LLM calls with a token-bucket rate limiter.
+# The limiter holds two buckets, one for requests per minute and one for tokens per
+# minute, and LM() acquires from both before every API request. A ConcurrencyLimit
+# caps the requests in flight at once, whichever thread sends them (tasks and their
+# --n-best candidates alike).
+
+def estimate_tokens(prompt, max_tokens=0):
+    # rough estimate (~4 characters per token) of the prompt plus the completion budget
+    if not isinstance(prompt, str):
+        prompt = json.dumps(prompt, ensure_ascii=False)
+    return len(prompt) // 4 + max_tokens
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # seconds until `amount` is available, 0 if it already is
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.waited = 0.0
+        self.requests_made = 0
+        self.held = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        # seconds this request was held back by the buckets
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait == 0.0:
+                    if self.requests is not None:
+                        self.requests.take(1)
+                    if self.tokens is not None:
+                        self.tokens.take(tokens)
+                    self.requests_made += 1
+                    self.held += waited > 0
+                    return waited
+                self.waited += wait
+            time.sleep(wait)
+            waited += wait
+
+    def summary(self):
+        if self.requests is None and self.tokens is None:
+            return "Rate limiter: no limits"
+        return (f"Rate limiter: {self.held}/{self.requests_made} requests held back, "
+                f"{self.waited:.1f}s waited in total")
+
+
+class ConcurrencyLimit:
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.waited = 0.0
+        self.held = 0
+        self._slots = threading.BoundedSemaphore(limit) if limit else None
+        self._lock = threading.Lock()
+
+    def acquire(self, check=None, poll=0.05):
+        # seconds this request waited for a free slot; check() is called while waiting
+        # and raises to give up (a cancelled --n-best candidate)
+        if self._slots is None or self._slots.acquire(blocking=False):
+            return 0.0
+        start = time.monotonic()
+        while not self._slots.acquire(timeout=poll):
+            if check is not None:
+                check()
+        waited = time.monotonic() - start
+        with self._lock:
+            self.waited += waited
+            self.held += 1
+        return waited
+
+    def release(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def summary(self):
+        if self._slots is None:
+            return "Concurrency limit: none"
+        return (f"Concurrency limit: at most {self.limit} requests in flight, "
+                f"{self.held} requests held back, {self.waited:.1f}s waited in total")
+
+
+def dispatch(fn, items, max_workers=4):
+    # run fn over items concurrently and return the results in the order of items
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, items))
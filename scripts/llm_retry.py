@@ -0,0 +1,172 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+# In-process retries for LM(). Transient API errors (rate limits, timeouts, 5xx) are
+# retried with exponential backoff and full jitter, honouring the retry-after hint of
+# the server when there is one. A circuit breaker shared by all task threads pauses
+# every caller for a while when most recent calls fail, instead of all of them
+# hammering an API that is down.
+
+# openai 0.x error classes worth retrying, matched by name so other backends can raise them too
+RETRYABLE_ERRORS = {'RateLimitError', 'APIError', 'Timeout', 'TimeoutError', 'ServiceUnavailableError',
+                    'APIConnectionError', 'TryAgain', 'ConnectionError'}
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(exc):
+    status = getattr(exc, 'http_status', None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+def retry_after(exc):
+    # seconds the server asked us to wait, None without a hint
+    headers = getattr(exc, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after', headers.get('Retry-After'))
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    # closed: calls go through, their outcomes are counted
+    # open: every caller waits until open_until
+    # half-open: after the pause, a single probe call goes through and the others wait for
+    #   it; the breaker closes when it succeeds and opens again, with a doubled cooldown,
+    #   when it fails
+    # wait() returns a token for record(), so failures of calls started before the breaker
+    # opened (still in flight during the pause) are ignored instead of tripping it again.
+    def __init__(self, window=20, min_calls=5, failure_rate=0.5, cooldown=30.0, max_cooldown=300.0):
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = 'closed'
+        self.open_until = 0.0
+        self.opened_at = None
+        self.trips = 0
+        self.probes = 0
+        self._probing = False
+        self._open_time = 0.0
+        self._cond = threading.Condition()
+
+    def wait(self):
+        # block while the breaker is open or a probe is running; (trips, probe) token for record()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self.state == 'open' and now >= self.open_until:
+                    self.state = 'half-open'
+                if self.state == 'closed':
+                    return self.trips, False
+                if self.state == 'half-open' and not self._probing:
+                    self._probing = True
+                    self.probes += 1
+                    return self.trips, True
+                self._cond.wait(self.open_until - now if self.state == 'open' else None)
+
+    def record(self, success, token=None):
+        with self._cond:
+            trips, probe = token if token is not None else (self.trips, False)
+            if trips != self.trips:
+                # started before the breaker opened
+                return
+            if probe:
+                self._probing = False
+                if success:
+                    self._close()
+                else:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self._trip()
+                self._cond.notify_all()
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if not success and len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+                self._trip()
+
+    def _trip(self):
+        now = time.monotonic()
+        if self.opened_at is None:
+            self.opened_at = now
+        self.state = 'open'
+        self.open_until = now + self.cooldown
+        self.outcomes.clear()
+        self.trips += 1
+
+    def _close(self):
+        self._open_time += time.monotonic() - self.opened_at
+        self.opened_at = None
+        self.state = 'closed'
+        self.cooldown = self.base_cooldown
+
+    @property
+    def open_time(self):
+        # seconds the calls were held back, up to now or the end of the pause when still open
+        with self._cond:
+            if self.opened_at is None:
+                return self._open_time
+            return self._open_time + min(time.monotonic(), self.open_until) - self.opened_at
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, breaker=None, seed=None):
+        # seed: fixes the jitter sequence, for reproducible benchmarks
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.rng = random.Random(seed)
+        self.retries = 0
+        self.retried_calls = 0
+        self.gave_up = 0
+        self.backoff = 0.0
+        self._lock = threading.Lock()
+
+    def delay(self, attempt, exc):
+        hint = retry_after(exc)
+        if hint is not None:
+            return min(hint, self.max_delay)
+        with self._lock:
+            return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn):
+        # (result of fn(), number of retries); the last error is raised with a `retries` attribute
+        attempt = 0
+        while True:
+            token = self.breaker.wait()
+            try:
+                result = fn()
+            except Exception as e:
+                retryable = is_retryable(e)
+                # an error the API answered with is not an outage
+                self.breaker.record(not retryable, token)
+                if not retryable or attempt >= self.max_retries:
+                    with self._lock:
+                        self.gave_up += retryable
+                    e.retries = attempt
+                    raise
+                delay = self.delay(attempt, e)
+                with self._lock:
+                    self.retries += 1
+                    self.retried_calls += attempt == 0
+                    self.backoff += delay
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record(True, token)
+            return result, attempt
+
+    def summary(self):
+        return (f"Retries: {self.retries} retries over {self.retried_calls} calls ({self.backoff:.1f}s backoff), "
+                f"{self.gave_up} calls gave up; circuit breaker opened {self.breaker.trips} times, "
+                f"{self.breaker.probes} probe calls ({self.breaker.open_time:.1f}s paused)")
@@ -0,0 +1,120 @@
+import re
+import threading
+
+
+# Incremental checks on a streamed Python plan. The monitor gets the completion text as
+# it arrives and raises GenerationAborted as soon as the output is clearly unusable, so
+# the request can be cancelled instead of waiting for the full completion.
+
+CODE_LINE = re.compile(r"^(#|def |class |import |from |for |if |elif |else|while |with |try|except|return|pass|"
+                       r"break|continue|global |@|[\)\]\}'\"]|.*,$|[\w\.\[\]]+\s*(=|\())")
+CALL = re.compile(r"(?<![\w\.])([A-Za-z_]\w*)\s*\(")
+DEF = re.compile(r"^\s*def\s+(\w+)\s*\(")
+
+NAME_STOPWORDS = {'the', 'a', 'an', 'and', 'in', 'on', 'it', 'to', 'into', 'of', 'task'}
+PREPARATION_WORDS = {'pick', 'up', 'pickup'}
+
+
+class GenerationAborted(Exception):
+    def __init__(self, reason, partial_text=""):
+        super().__init__(reason)
+        self.reason = reason
+        self.partial_text = partial_text
+
+
+class GenerationCancelled(GenerationAborted):
+    # the generation is no longer needed, another --n-best candidate was accepted
+    pass
+
+
+def check_cancelled(cancel, partial_text=""):
+    if cancel is not None and cancel.is_set():
+        raise GenerationCancelled("cancelled, another candidate was accepted", partial_text)
+
+
+class PlanMonitor:
+    def __init__(self, task, skills, example_functions):
+        self.task_words = set(re.findall(r"[a-z]+", task.lower()))
+        self.skills = set(skills)
+        self.example_functions = set(example_functions)
+        self.text = ""
+        self._pending = ""
+        # threading.Event set when the generation is no longer needed (--n-best)
+        self.cancel = None
+
+    def fresh(self):
+        # a new monitor with the same checks for another generation
+        monitor = PlanMonitor.__new__(PlanMonitor)
+        monitor.task_words = self.task_words
+        monitor.skills = self.skills
+        monitor.example_functions = self.example_functions
+        monitor.text = ""
+        monitor._pending = ""
+        monitor.cancel = self.cancel
+        return monitor
+
+    def cancellable(self, event):
+        # a new monitor that also stops the generation once `event` is set
+        monitor = self.fresh()
+        monitor.cancel = event
+        return monitor
+
+    def feed(self, chunk):
+        check_cancelled(self.cancel, self.text)
+        self.text += chunk
+        self._pending += chunk
+        *lines, self._pending = self._pending.split('\n')
+        for line in lines:
+            self.check_line(line)
+
+    def finish(self):
+        if self._pending:
+            self.check_line(self._pending)
+            self._pending = ""
+
+    def abort(self, reason):
+        raise GenerationAborted(reason, self.text)
+
+    def check_line(self, line):
+        code = line.strip()
+        if not code or code.startswith("```"):
+            return
+        if not CODE_LINE.match(code):
+            self.abort(f"prose instead of code: {code[:60]!r}")
+
+        match = DEF.match(line)
+        if match and match.group(1) in self.example_functions and not self.fits_task(match.group(1)):
+            self.abort(f"copied training example function {match.group(1)}()")
+
+        # skills are CamelCase, any other CamelCase call is a skill that does not exist
+        for name in CALL.findall(code.split('#')[0]):
+            if name[0].isupper() and name not in self.skills:
+                self.abort(f"call to unknown skill {name}()")
+
+    def fits_task(self, fn_name):
+        return fits_task(fn_name, self.task_words)
+
+
+def fits_task(fn_name, task_words):
+    # an example function name is fine when the task itself is about the same thing;
+    # picking an object up is a step of most tasks, pick_up_fork only has to match the fork
+    words = [w for w in fn_name.lower().split('_') if w and w not in NAME_STOPWORDS and w not in PREPARATION_WORDS]
+    return all(w in task_words or w.rstrip('s') in task_words for w in words)
+
+
+class StreamStats:
+    def __init__(self):
+        self.streamed = 0
+        self.aborted = 0
+        self.reasons = []
+        self._lock = threading.Lock()
+
+    def record(self, aborted_reason=None):
+        with self._lock:
+            self.streamed += 1
+            if aborted_reason is not None:
+                self.aborted += 1
+                self.reasons.append(aborted_reason)
+
+    def summary(self):
+        return f"Streaming: {self.streamed} monitored generations, {self.aborted} aborted early"
@@ -0,0 +1,195 @@
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from llm_dispatch import estimate_tokens
+
+
+# Per-call LLM telemetry. Every LM() call records its stage, task, model, token usage,
+# latency, retries and finish reason. run_llm.py writes the calls of each task to
+# telemetry.jsonl in the task's logs folder, and this script summarizes them:
+#   python3 scripts/llm_telemetry.py logs
+#   python3 scripts/llm_telemetry.py logs/*_plans_10-18-2026-*
+
+TELEMETRY_FILE = "telemetry.jsonl"
+
+# USD per 1000 prompt / completion tokens, update when the OpenAI prices change
+PRICES = {
+    'gpt-4': (0.03, 0.06),
+    'gpt-3.5-turbo': (0.0015, 0.002),
+    'gpt-3.5-turbo-16k': (0.003, 0.004),
+}
+
+
+def call_cost(record):
+    # cached and replayed responses cost nothing
+    price = PRICES.get(record['model'])
+    if price is None or record.get('cached') or record.get('backend') not in (None, 'openai', 'record'):
+        return 0.0
+    return (record['prompt_tokens'] * price[0] + record['completion_tokens'] * price[1]) / 1000
+
+
+def percentile(values, q):
+    # linear interpolation between the closest ranks
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+class Telemetry:
+    def __init__(self, backend='openai'):
+        self.backend = backend
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def task(self, **fields):
+        # calls made by this thread inside the block are tagged with `fields` and collected in the yielded list
+        calls = []
+        self._local.fields = fields
+        self._local.calls = calls
+        try:
+            yield calls
+        finally:
+            self._local.fields = {}
+            self._local.calls = None
+
+    def context(self):
+        # task fields and call list of this thread, for work handed to other threads
+        return getattr(self._local, 'fields', {}), getattr(self._local, 'calls', None)
+
+    @contextmanager
+    def joined(self, context):
+        # record the calls of this thread under the task of `context`
+        self._local.fields, self._local.calls = context
+        try:
+            yield
+        finally:
+            self._local.fields = {}
+            self._local.calls = None
+
+    def record_call(self, stage, model, prompt, response, text, latency, cached=False, retries=0,
+                    rate_wait=0.0, finish_reason=None, error=None):
+        # rate_wait: seconds the request was held back by the --rpm/--tpm limiter, part of latency
+        usage = (response or {}).get("usage")
+        record = dict(getattr(self._local, 'fields', {}))
+        record.update({
+            'time': time.time(),
+            'stage': stage,
+            'model': model,
+            'backend': self.backend,
+            'cached': cached,
+            'prompt_tokens': usage["prompt_tokens"] if usage else estimate_tokens(prompt),
+            'completion_tokens': usage["completion_tokens"] if usage else estimate_tokens(text or ""),
+            'estimated_usage': not usage,
+            'latency': round(latency, 4),
+            'retries': retries,
+            'rate_wait': round(rate_wait, 4),
+            'finish_reason': finish_reason or (response["choices"][0].get("finish_reason") if response else None),
+        })
+        if error is not None:
+            record['error'] = error
+        with self._lock:
+            self.records.append(record)
+        calls = getattr(self._local, 'calls', None)
+        if calls is not None:
+            calls.append(record)
+        return record
+
+    def summary(self):
+        return format_summary(summarize(self.records))
+
+
+def write_jsonl(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(paths):
+    # telemetry files, or logs folders containing them (searched one level down)
+    records = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = glob.glob(os.path.join(path, TELEMETRY_FILE)) + glob.glob(os.path.join(path, "*", TELEMETRY_FILE))
+        else:
+            files = [path]
+        for file in sorted(files):
+            with open(file) as f:
+                records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def summarize(records):
+    rows = {}
+    for r in records:
+        row = rows.setdefault((r['stage'], r['model']), {'calls': 0, 'cached': 0, 'errors': 0, 'cancelled': 0, 'retries': 0,
+                                                          'prompt_tokens': 0, 'completion_tokens': 0,
+                                                          'cost': 0.0, 'rate_wait': 0.0, 'latencies': []})
+        row['calls'] += 1
+        row['cached'] += bool(r.get('cached'))
+        row['errors'] += r.get('finish_reason') in ('error', 'aborted')
+        # --n-best candidates stopped once another one was accepted, not failures
+        row['cancelled'] += r.get('finish_reason') == 'cancelled'
+        row['retries'] += r.get('retries', 0)
+        row['prompt_tokens'] += r['prompt_tokens']
+        row['completion_tokens'] += r['completion_tokens']
+        row['cost'] += call_cost(r)
+        row['rate_wait'] += r.get('rate_wait', 0.0)
+        if not r.get('cached'):
+            row['latencies'].append(r['latency'])
+    for row in rows.values():
+        row['p50'] = percentile(row['latencies'], 50)
+        row['p95'] = percentile(row['latencies'], 95)
+    return rows
+
+
+def format_summary(rows):
+    lines = [f"{'stage':<10} {'model':<18} {'calls':>5} {'cached':>6} {'errors':>6} {'cancel':>6} {'retries':>7} "
+             f"{'p50 s':>7} {'p95 s':>7} {'limit s':>7} {'prompt tok':>10} {'compl tok':>9} {'cost $':>8}"]
+    total = 0.0
+    for (stage, model), row in sorted(rows.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        total += row['cost']
+        lines.append(f"{str(stage):<10} {model:<18} {row['calls']:>5} {row['cached']:>6} {row['errors']:>6} {row['cancelled']:>6} {row['retries']:>7} "
+                     f"{row['p50']:>7.2f} {row['p95']:>7.2f} {row['rate_wait']:>7.1f} {row['prompt_tokens']:>10} {row['completion_tokens']:>9} {row['cost']:>8.3f}")
+    lines.append(f"Total cost: ${total:.2f}")
+    return "\n".join(lines)
+
+
+def cost_per_task(records, model):
+    # mean API cost of a task with `model`, None without telemetry for it
+    tasks = {}
+    for r in records:
+        if r['model'] == model and not r.get('cached') and r.get('backend') in (None, 'openai', 'record'):
+            key = (r.get('floor_plan'), r.get('task'))
+            tasks[key] = tasks.get(key, 0.0) + call_cost(r)
+    if not tasks:
+        return None
+    return sum(tasks.values()) / len(tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+",
+                        help="telemetry.jsonl files or logs folders")
+    parser.add_argument("--cost-per-task", type=str, default=None, metavar="MODEL",
+                        help="Only print the mean cost of a task with MODEL (nothing without telemetry for it)")
+    args = parser.parse_args()
+
+    records = read_jsonl(args.paths)
+    if args.cost_per_task:
+        cost = cost_per_task(records, args.cost_per_task)
+        if cost is not None:
+            print (f"{cost:.4f}")
+    else:
+        print (f"{len(records)} LLM calls")
+        print (format_summary(summarize(records)))
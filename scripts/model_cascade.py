@@ -0,0 +1,62 @@
+import re
+import threading
+
+
+# Model cascade (--cascade-model). Each stage of a task is first generated with the
+# cheaper model and its output checked; only a stage whose output fails the checks is
+# generated again with the stronger --gpt-version, so easy tasks finish at the latency
+# and price of the small model. Escalations are counted per stage.
+
+
+def allocation_issues(text, robots):
+    # an allocation has to assign the subtasks to robots that exist
+    numbers = [int(n) for n in re.findall(r"\b[Rr]obots?\s*(\d+)", text)]
+    numbers += [int(n) for n in re.findall(r"\band\s+(\d+)\b", text)]
+    if not numbers:
+        return ["the allocation assigns no robot"]
+    unknown = sorted({n for n in numbers if not 1 <= n <= len(robots)})
+    if unknown:
+        return [f"the allocation uses robot {n}, there are {len(robots)} robots" for n in unknown]
+    return []
+
+
+class Cascade:
+    def __init__(self, models, log=print):
+        # models: cheapest first, the last one is the strongest
+        self.models = models
+        self.log = log
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def run(self, stage, generate, validate, label=""):
+        # output of generate(model, strongest) for the first model whose output validate() accepts;
+        # the strongest model's output is returned (or its error raised) whatever the checks say
+        for level, model in enumerate(self.models):
+            last = level == len(self.models) - 1
+            try:
+                output = generate(model, last)
+            except Exception as e:
+                if last:
+                    self.record(stage, level)
+                    raise
+                issues = [f"{type(e).__name__}: {e}"]
+            else:
+                issues = [] if last else validate(output)
+            if not issues:
+                self.record(stage, level)
+                return output
+            self.log(f"{label}{stage} output of {model} rejected, escalating to {self.models[level + 1]}: {'; '.join(issues)}")
+
+    def record(self, stage, level):
+        with self._lock:
+            counts = self.stages.setdefault(stage, [0] * len(self.models))
+            counts[level] += 1
+
+    def summary(self):
+        lines = []
+        for stage, counts in self.stages.items():
+            total = sum(counts)
+            escalated = total - counts[0]
+            lines.append(f"Cascade {stage}: {escalated}/{total} escalated ({100 * escalated / total:.0f}%), "
+                         + ", ".join(f"{n} finished with {m}" for m, n in zip(self.models, counts)))
+        return "\n".join(lines) if lines else "Cascade: no stage generated"
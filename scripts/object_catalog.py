@@ -0,0 +1,102 @@
+import argparse
+import glob
+import json
+import os
+import re
+from datetime import datetime
+from importlib import metadata
+
+
+# Snapshot of the objects in every AI2-THOR floor plan (type, id, mass, position), so
+# run_llm.py does not have to start Unity just to list the objects of a scene.
+# Build it once with:
+#   python3 scripts/object_catalog.py --floor-plan all
+
+CATALOG_VERSION = 1
+DEFAULT_CATALOG = "data/object_catalog.json"
+
+
+def ai2thor_version():
+    try:
+        return metadata.version("ai2thor")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def list_floor_plans(test_set):
+    # floor plans with a FloorPlan<N>.json task file in the test set
+    files = glob.glob(f"./data/{test_set}/FloorPlan*.json")
+    ids = [re.fullmatch(r"FloorPlan(\d+)\.json", os.path.basename(f)) for f in files]
+    return sorted(int(m.group(1)) for m in ids if m is not None)
+
+
+def snapshot_floor_plan(controller, floor_plan):
+    controller.reset("FloorPlan" + str(floor_plan))
+    objects = []
+    for obj in controller.last_event.metadata["objects"]:
+        objects.append({'objectType': obj["objectType"],
+                        'objectId': obj["objectId"],
+                        'mass': obj["mass"],
+                        'position': obj["position"]})
+    return objects
+
+
+def build_catalog(floor_plans, path=DEFAULT_CATALOG):
+    import ai2thor.controller
+
+    catalog = load_catalog(path)
+    if catalog is None or is_stale(catalog):
+        catalog = {'version': CATALOG_VERSION, 'floor_plans': {}}
+    catalog['ai2thor_version'] = ai2thor_version()
+    catalog['created'] = datetime.now().strftime("%m-%d-%Y-%H-%M-%S")
+
+    controller = ai2thor.controller.Controller(scene="FloorPlan" + str(floor_plans[0]))
+    try:
+        for floor_plan in floor_plans:
+            catalog['floor_plans'][str(floor_plan)] = snapshot_floor_plan(controller, floor_plan)
+            print (f"FloorPlan{floor_plan}: {len(catalog['floor_plans'][str(floor_plan)])} objects")
+    finally:
+        controller.stop()
+
+    with open(path, 'w') as f:
+        json.dump(catalog, f, indent=1)
+    print (f"Catalog saved to {path}")
+    return catalog
+
+
+def load_catalog(path=DEFAULT_CATALOG):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def is_stale(catalog):
+    # a catalog from another format version or another simulator build cannot be trusted
+    if catalog.get('version') != CATALOG_VERSION:
+        return True
+    installed = ai2thor_version()
+    return installed is not None and catalog.get('ai2thor_version') not in (None, installed)
+
+
+def catalog_objects(catalog, floor_plan):
+    # objects of a floor plan, None if the catalog cannot be used for it
+    if catalog is None or is_stale(catalog):
+        return None
+    return catalog['floor_plans'].get(str(floor_plan))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--floor-plan", type=str, nargs="+", required=True,
+                        help="Floor plan numbers, or 'all' for every floor plan in the test set")
+    parser.add_argument("--test-set", type=str, default="final_test")
+    parser.add_argument("--catalog", type=str, default=DEFAULT_CATALOG)
+    args = parser.parse_args()
+
+    if "all" in args.floor_plan:
+        floor_plans = list_floor_plans(args.test_set)
+    else:
+        floor_plans = [int(v) for v in args.floor_plan]
+
+    build_catalog(floor_plans, args.catalog)
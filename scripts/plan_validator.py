@@ -0,0 +1,162 @@
+import ast
+import re
+
+from llm_stream import fits_task
+
+
+# Static checks on a generated code_plan.py, run right after code generation instead of
+# finding out in the simulator. The plan is parsed, never executed:
+#   - every CamelCase call is a skill of resources/actions.py
+#   - the robots bound to a function (through its call sites, threads included) have the skills it uses
+#   - robots[i] and robot_list[i] indices are in range
+#   - object names exist in the floor plan (skills match them as a prefix of the object id)
+#   - training example functions unrelated to the task were not copied
+
+MAX_BINDING_PASSES = 5
+
+
+class PlanValidationError(Exception):
+    def __init__(self, issues):
+        super().__init__("; ".join(issues))
+        self.issues = issues
+
+
+def constant_index(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    return None
+
+
+class PlanValidator:
+    def __init__(self, robots, object_names, skills, example_functions=(), task=""):
+        self.robots = robots
+        self.object_names = set(object_names)
+        self.skills = set(skills)
+        self.example_functions = set(example_functions)
+        self.task_words = set(re.findall(r"[a-z]+", task.lower()))
+
+    def validate(self, code):
+        # list of issues, empty for a valid plan
+        try:
+            tree = ast.parse(code)
+        except SyntaxError as e:
+            return [f"syntax error line {e.lineno}: {e.msg}"]
+
+        self.issues = []
+        self.functions = {n.name: n for n in ast.walk(tree) if isinstance(n, ast.FunctionDef)}
+        for name in self.functions:
+            if name in self.example_functions and not fits_task(name, self.task_words):
+                self.issue(f"copied training example function {name}()")
+
+        bindings = self.bind_robots(tree)
+        module_body = [n for n in tree.body if not isinstance(n, ast.FunctionDef)]
+        for node in module_body:
+            self.check_calls(node, None, [None])
+        for name, fn in self.functions.items():
+            param = fn.args.args[0].arg if fn.args.args else None
+            for stmt in fn.body:
+                self.check_calls(stmt, param, bindings.get(name) or [None])
+        return self.issues
+
+    def issue(self, msg):
+        if msg not in self.issues:
+            self.issues.append(msg)
+
+    def robots_of(self, node, param, binding):
+        # indices into `robots` of a robot expression, None when it cannot be resolved statically
+        if isinstance(node, ast.Name):
+            if node.id == 'robots':
+                return list(range(len(self.robots)))
+            if node.id == param:
+                return binding
+            return None
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+            i = constant_index(node.slice)
+            if i is None:
+                return None
+            if node.value.id == 'robots':
+                if not 0 <= i < len(self.robots):
+                    self.issue(f"robots[{i}] is out of range, there are {len(self.robots)} robots")
+                    return None
+                return [i]
+            if node.value.id == param and binding is not None:
+                if not 0 <= i < len(binding):
+                    self.issue(f"{param}[{i}] is out of range, the function is called with {len(binding)} robot(s)")
+                    return None
+                return [binding[i]]
+            return None
+        if isinstance(node, (ast.List, ast.Tuple)):
+            indices = []
+            for elt in node.elts:
+                robots = self.robots_of(elt, param, binding)
+                if robots is None:
+                    return None
+                indices += robots
+            return indices
+        return None
+
+    def call_targets(self, call):
+        # (function name, robot argument) of a direct call or of a threading.Thread(target=..., args=(...))
+        if isinstance(call.func, ast.Name) and call.func.id in self.functions:
+            return call.func.id, call.args[0] if call.args else None
+        if isinstance(call.func, ast.Attribute) and call.func.attr == 'Thread':
+            kwargs = {k.arg: k.value for k in call.keywords}
+            target = kwargs.get('target')
+            if isinstance(target, ast.Name) and target.id in self.functions:
+                args = kwargs.get('args')
+                first = args.elts[0] if isinstance(args, ast.Tuple) and args.elts else None
+                return target.id, first
+        return None, None
+
+    def bind_robots(self, tree):
+        # robots each function is called with, propagated through nested calls
+        bindings = {}
+        scopes = [(n, None, None) for n in tree.body if not isinstance(n, ast.FunctionDef)]
+        for _ in range(MAX_BINDING_PASSES):
+            changed = False
+            for name, fn in self.functions.items():
+                param = fn.args.args[0].arg if fn.args.args else None
+                scopes += [(stmt, param, b) for b in bindings.get(name, []) for stmt in fn.body]
+            for node, param, binding in scopes:
+                for call in [n for n in ast.walk(node) if isinstance(n, ast.Call)]:
+                    fn_name, arg = self.call_targets(call)
+                    if fn_name is None or arg is None:
+                        continue
+                    robots = self.robots_of(arg, param, binding)
+                    if robots is not None and robots not in bindings.setdefault(fn_name, []):
+                        bindings[fn_name].append(robots)
+                        changed = True
+            scopes = []
+            if not changed:
+                break
+        return bindings
+
+    def check_calls(self, node, param, bindings):
+        for call in [n for n in ast.walk(node) if isinstance(n, ast.Call)]:
+            if not isinstance(call.func, ast.Name):
+                continue
+            skill = call.func.id
+            if skill in self.functions or not skill[0].isupper():
+                continue
+            if skill not in self.skills:
+                self.issue(f"call to unknown skill {skill}()")
+                continue
+
+            for arg in call.args[1:]:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and not self.object_exists(arg.value):
+                    self.issue(f"{skill}() uses object '{arg.value}' which is not in the floor plan")
+            if not call.args:
+                self.issue(f"{skill}() is called without a robot")
+                continue
+            for binding in bindings:
+                for i in self.robots_of(call.args[0], param, binding) or []:
+                    robot = self.robots[i]
+                    if skill not in robot['skills']:
+                        self.issue(f"{robot['name']} does not have the skill {skill}")
+
+    def object_exists(self, name):
+        return any(obj.startswith(name) for obj in self.object_names)
+
+
+def validate_plan(code, robots, object_names, skills, example_functions=(), task=""):
+    return PlanValidator(robots, object_names, skills, example_functions, task).validate(code)
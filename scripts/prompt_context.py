@@ -0,0 +1,140 @@
+import re
+
+from llm_dispatch import estimate_tokens
+
+
+# Builds the `objects = [...]` block that goes into the decomposition, allocation and
+# code prompts.
+#   full     - every scene object as returned by AI2-THOR (original behaviour)
+#   compact  - duplicates collapsed into a count and masses rounded
+#   relevant - compact, keeping only objects related to the task plus common receptacles
+
+CONTEXT_MODES = ['full', 'compact', 'relevant']
+
+# receptacles that plans use to put things down, kept for every task
+COMMON_RECEPTACLES = ['CounterTop', 'DiningTable', 'Sink', 'SinkBasin', 'Fridge', 'Cabinet', 'Drawer',
+                      'GarbageCan', 'Shelf', 'Bowl', 'Plate']
+
+# task words that imply objects not named in the task
+RELATED_OBJECTS = {
+    'wash': ['Sink', 'SinkBasin', 'Faucet'],
+    'clean': ['Sink', 'SinkBasin', 'Faucet', 'DishSponge', 'ScrubBrush'],
+    'scrub': ['ScrubBrush', 'DishSponge'],
+    'sponge': ['DishSponge', 'ScrubBrush'],
+    'dishsponge': ['DishSponge', 'ScrubBrush'],
+    'rinse': ['Sink', 'SinkBasin', 'Faucet'],
+    'slice': ['Knife', 'ButterKnife'],
+    'cut': ['Knife', 'ButterKnife'],
+    'chop': ['Knife', 'ButterKnife'],
+    'cook': ['StoveBurner', 'StoveKnob', 'Pan', 'Pot', 'Microwave'],
+    'fry': ['StoveBurner', 'StoveKnob', 'Pan'],
+    'boil': ['StoveBurner', 'StoveKnob', 'Pot', 'Kettle'],
+    'heat': ['Microwave', 'StoveBurner', 'StoveKnob'],
+    'microwave': ['Microwave'],
+    'warm': ['Microwave', 'StoveBurner', 'StoveKnob'],
+    'chill': ['Fridge'],
+    'cool': ['Fridge'],
+    'refrigerator': ['Fridge'],
+    'throw': ['GarbageCan'],
+    'trash': ['GarbageCan'],
+    'garbage': ['GarbageCan'],
+    'dispose': ['GarbageCan'],
+    'light': ['LightSwitch', 'FloorLamp', 'DeskLamp'],
+    'lamp': ['FloorLamp', 'DeskLamp'],
+    'lights': ['LightSwitch', 'FloorLamp', 'DeskLamp'],
+    'lit': ['LightSwitch', 'FloorLamp', 'DeskLamp'],
+    'bright': ['LightSwitch', 'FloorLamp', 'DeskLamp'],
+    'dark': ['LightSwitch'],
+    'toast': ['Toaster', 'Bread'],
+    'coffee': ['CoffeeMachine', 'Mug'],
+    'tv': ['Television', 'RemoteControl'],
+    'television': ['Television', 'RemoteControl'],
+    'phone': ['CellPhone'],
+    'stove': ['StoveBurner', 'StoveKnob'],
+    'break': ['Vase', 'Bottle', 'Mirror'],
+    'water': ['Faucet', 'Sink', 'SinkBasin', 'WateringCan', 'HousePlant'],
+    'plant': ['HousePlant', 'WateringCan'],
+    'vegetable': ['Tomato', 'Lettuce', 'Potato'],
+    'vegetables': ['Tomato', 'Lettuce', 'Potato'],
+    'fruit': ['Apple'],
+    'fruits': ['Apple'],
+}
+
+# head words that name an object on their own (ButterKnife -> knife); the head word of
+# other compound names is not enough, "top" is no CounterTop and "knob" no StoveKnob
+HEAD_NOUNS = {name.lower() for names in RELATED_OBJECTS.values() for name in names
+              if len(re.findall(r"[A-Z]", name)) == 1}
+
+
+def round_mass(mass):
+    if mass == 0 or mass >= 0.01:
+        return round(mass, 2)
+    return float(f"{mass:.1g}")
+
+
+def compact_objects(objects):
+    # collapse duplicates into a count, keeping the heaviest instance for mass constraints
+    compact = {}
+    for obj in objects:
+        entry = compact.get(obj['name'])
+        if entry is None:
+            compact[obj['name']] = {'name': obj['name'], 'mass': round_mass(obj['mass'])}
+        else:
+            entry['mass'] = max(entry['mass'], round_mass(obj['mass']))
+            entry['count'] = entry.get('count', 1) + 1
+    return list(compact.values())
+
+
+def name_words(name):
+    # 'SinkBasin' -> ['sink', 'basin']
+    return [w.lower() for w in re.findall(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+", name)]
+
+
+def task_words(task):
+    words = set()
+    for w in re.findall(r"[a-z]+", task.lower()):
+        words.add(w)
+        # naive singular form, "tomatoes" -> "tomato", "apples" -> "apple"
+        if w.endswith('es'):
+            words.add(w[:-2])
+        if w.endswith('s'):
+            words.add(w[:-1])
+    return words
+
+
+def is_relevant(name, task, words):
+    parts = name_words(name)
+    # compound names written as one word in the task, e.g. "countertop"
+    if len(parts) > 1 and name.lower() in task.lower().replace(' ', ''):
+        return True
+    if all(p in words for p in parts) or (parts[-1] in HEAD_NOUNS and parts[-1] in words):
+        return True
+    # task words that extend an object name, "breadloaf" -> Bread (short names such as Pot would match "potato")
+    return len(name) >= 4 and any(w.startswith(name.lower()) for w in words)
+
+
+def relevant_objects(objects, task):
+    words = task_words(task)
+    related = set(COMMON_RECEPTACLES)
+    for w in words:
+        related.update(RELATED_OBJECTS.get(w, []))
+    return [o for o in objects if o['name'] in related or is_relevant(o['name'], task, words)]
+
+
+def build_objects_context(objects, task, mode='full'):
+    if mode == 'full':
+        selected = objects
+    elif mode == 'compact':
+        selected = compact_objects(objects)
+    elif mode == 'relevant':
+        selected = relevant_objects(compact_objects(objects), task)
+    else:
+        raise ValueError(f"Unknown object context mode: {mode}")
+    return f"\n\nobjects = {selected}"
+
+
+def context_savings(objects, task, mode):
+    # prompt tokens of the objects block in full and in the selected mode
+    full = estimate_tokens(build_objects_context(objects, task, 'full'))
+    selected = estimate_tokens(build_objects_context(objects, task, mode))
+    return full, selected
@@ -1,46 +1,193 @@
-import copy
-import glob
 import json
 import os
 import argparse
 from pathlib import Path
 from datetime import datetime
-import random
-import subprocess
-
-import openai
-import ai2thor.controller
+import re
+import threading
+import time
 
 import sys
 sys.path.append(".")
 
 import resources.actions as actions
 import resources.robots as robots
+from resources.fleet import load_fleet
+
+from llm_cache import LLMCache, request_key
+from llm_dispatch import ConcurrencyLimit, RateLimiter, dispatch, estimate_tokens
+from object_catalog import DEFAULT_CATALOG, build_catalog, catalog_objects, is_stale, list_floor_plans, load_catalog
+from example_retrieval import ExampleIndex, example_function_names
+from prompt_context import CONTEXT_MODES, build_objects_context, context_savings
+from llm_stream import GenerationAborted, GenerationCancelled, PlanMonitor, StreamStats, check_cancelled
+from llm_backend import BACKENDS, DEFAULT_BACKEND_DIR, make_backend
+from llm_telemetry import TELEMETRY_FILE, Telemetry, write_jsonl
+from plan_validator import PlanValidationError, validate_plan
+from checkpoints import DEFAULT_CHECKPOINT_DIR, CheckpointStore, inputs_key
+from llm_retry import CircuitBreaker, RetryPolicy
+from batch_prompts import BATCH_MAX_TOKENS, TASK_MAX_TOKENS, BatchDecomposer, batch_prompt, split_sections, valid_section
+from allocation_solver import AllocationError, solve_allocation
+from code_templates import TemplateError, generate_allocated_code
+from speculative import Speculator, plan_issues
+from model_cascade import Cascade, allocation_issues
+from travel_costs import DEFAULT_TRAVEL_COSTS_DIR, load_travel_costs
+
+# backend, response cache, rate limiter and concurrency limit shared by every LM() call, configured in main
+backend = make_backend('openai')
+llm_cache = LLMCache(enabled=False)
+rate_limiter = RateLimiter()
+request_slots = ConcurrencyLimit()
+retry_policy = RetryPolicy()
+telemetry = Telemetry()
+stream_responses = False
+stream_stats = StreamStats()
+print_lock = threading.Lock()
+
+def log(msg):
+    # progress messages come from several task threads at once
+    with print_lock:
+        print (msg)
+
+
+def LM(prompt, gpt_version, max_tokens=128, temperature=0, stop=None, logprobs=1, frequency_penalty=0, monitor=None, stage=None):
+    # monitor: PlanMonitor that checks the generated plan while it is streamed (--stream)
+    # stage: pipeline stage of the request, used by the synthetic backend
+    # an --n-best candidate no longer needed is not sent, or stops streaming, once monitor.cancel is set
+    cancel = monitor.cancel if monitor is not None else None
+    if not stream_responses:
+        monitor = None
+    
+    # sampled (temperature > 0) responses are neither replayed nor stored
+    cacheable = temperature == 0
+    key = request_key(gpt_version, prompt, max_tokens, temperature, frequency_penalty, stop)
+    start = time.time()
+    cached = llm_cache.get(key) if cacheable else None
+    if cached is not None:
+        telemetry.record_call(stage, gpt_version, prompt, cached["response"], cached["text"], time.time() - start, cached=True)
+        if monitor is not None:
+            # cached plans go through the same checks as streamed ones
+            monitor = monitor.fresh()
+            try:
+                monitor.feed(cached["text"])
+                monitor.finish()
+            except GenerationCancelled:
+                raise
+            except GenerationAborted:
+                llm_cache.discard([key])
+                raise
+        return cached["response"], cached["text"]
+    
+    rate_wait = []
+    def attempt():
+        # every attempt waits for a free request slot (--max-concurrency) and the rate limiter,
+        # and streams with a new monitor
+        check_cancelled(cancel)
+        rate_wait.append(request_slots.acquire(lambda: check_cancelled(cancel)))
+        try:
+            rate_wait.append(rate_limiter.acquire(estimate_tokens(prompt, max_tokens)))
+            check_cancelled(cancel)
+            if monitor is not None:
+                return _LM_stream(prompt, gpt_version, max_tokens, temperature, stop, logprobs, frequency_penalty, monitor.fresh(), stage)
+            return _LM(prompt, gpt_version, max_tokens, temperature, stop, logprobs, frequency_penalty, stage)
+        finally:
+            request_slots.release()
+
+    start = time.time()
+    try:
+        (response, text), retries = retry_policy.call(attempt)
+    except GenerationCancelled as e:
+        telemetry.record_call(stage, gpt_version, prompt, None, e.partial_text, time.time() - start,
+                              rate_wait=sum(rate_wait), finish_reason="cancelled")
+        raise
+    except GenerationAborted as e:
+        telemetry.record_call(stage, gpt_version, prompt, None, e.partial_text, time.time() - start,
+                              rate_wait=sum(rate_wait), finish_reason="aborted", error=e.reason)
+        raise
+    except Exception as e:
+        telemetry.record_call(stage, gpt_version, prompt, None, "", time.time() - start, retries=getattr(e, 'retries', 0),
+                              rate_wait=sum(rate_wait), finish_reason="error", error=f"{type(e).__name__}: {e}")
+        raise
+    telemetry.record_call(stage, gpt_version, prompt, response, text, time.time() - start, retries=retries,
+                          rate_wait=sum(rate_wait))
+    if cacheable:
+        llm_cache.put(key, {"model": gpt_version, "response": response, "text": text})
+    return response, text
+
+def _LM_stream(prompt, gpt_version, max_tokens, temperature, stop, logprobs, frequency_penalty, monitor, stage=None):
+    # consume the completion as it arrives and cancel it as soon as the monitor rejects it
+    if "gpt" not in gpt_version:
+        response = backend.completion(model=gpt_version, 
+                                            prompt=prompt, 
+                                            max_tokens=max_tokens, 
+                                            temperature=temperature, 
+                                            stop=stop, 
+                                            logprobs=logprobs, 
+                                            frequency_penalty = frequency_penalty,
+                                            stream=True,
+                                            stage=stage)
+    else:
+        response = backend.chat_completion(model=gpt_version, 
+                                            messages=prompt, 
+                                            max_tokens=max_tokens, 
+                                            temperature=temperature, 
+                                            frequency_penalty = frequency_penalty,
+                                            stream=True,
+                                            stage=stage)
+    
+    finish_reason = None
+    try:
+        for chunk in response:
+            choice = chunk["choices"][0]
+            if "gpt" not in gpt_version:
+                monitor.feed(choice.get("text") or "")
+            else:
+                monitor.feed(choice["delta"].get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+        monitor.finish()
+    except GenerationAborted as e:
+        # a cancelled candidate was not rejected by the checks
+        stream_stats.record(None if isinstance(e, GenerationCancelled) else e.reason)
+        raise
+    finally:
+        # closing the stream cancels the rest of the generation
+        if hasattr(response, "close"):
+            response.close()
+    stream_stats.record()
+    
+    text = monitor.text.strip()
+    if "gpt" not in gpt_version:
+        choice = {"text": text, "finish_reason": finish_reason}
+    else:
+        choice = {"message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}
+    return {"model": gpt_version, "choices": [choice]}, text
 
-
-def LM(prompt, gpt_version, max_tokens=128, temperature=0, stop=None, logprobs=1, frequency_penalty=0):
+def _LM(prompt, gpt_version, max_tokens, temperature, stop, logprobs, frequency_penalty, stage=None):
     
     if "gpt" not in gpt_version:
-        response = openai.Completion.create(model=gpt_version, 
+        response = backend.completion(model=gpt_version, 
                                             prompt=prompt, 
                                             max_tokens=max_tokens, 
                                             temperature=temperature, 
                                             stop=stop, 
                                             logprobs=logprobs, 
-                                            frequency_penalty = frequency_penalty)
+                                            frequency_penalty = frequency_penalty,
+                                            stage=stage)
         
         return response, response["choices"][0]["text"].strip()
     
     else:
-        response = openai.ChatCompletion.create(model=gpt_version, 
+        response = backend.chat_completion(model=gpt_version, 
                                             messages=prompt, 
                                             max_tokens=max_tokens, 
                                             temperature=temperature, 
-                                            frequency_penalty = frequency_penalty)
+                                            frequency_penalty = frequency_penalty,
+                                            stage=stage)
         
         return response, response["choices"][0]["message"]["content"].strip()
 
 def set_api_key(openai_api_key):
+    import openai
+
     # .txt 확장자가 있으면 그대로, 없으면 추가
     if openai_api_key.endswith('.txt'):
         key_file = Path(openai_api_key)
@@ -60,112 +207,71 @@ def convert_to_dict_objprop(objs, obj_mass):
         objs_dict.append(obj_dict)
     return objs_dict
 
-def get_ai2_thor_objects(floor_plan_id):
-    # connector to ai2thor to get object list
-    controller = ai2thor.controller.Controller(scene="FloorPlan"+str(floor_plan_id))
-    obj = list([obj["objectType"] for obj in controller.last_event.metadata["objects"]])
-    obj_mass = list([obj["mass"] for obj in controller.last_event.metadata["objects"]])
-    controller.stop()
-    obj = convert_to_dict_objprop(obj, obj_mass)
-    return obj
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--floor-plan", type=int, required=True)
-    parser.add_argument("--openai-api-key-file", type=str, default="api_key")
-    parser.add_argument("--gpt-version", type=str, default="gpt-4", 
-                        choices=['gpt-3.5-turbo', 'gpt-4', 'gpt-3.5-turbo-16k'])
-    
-    parser.add_argument("--prompt-decompse-set", type=str, default="train_task_decompose", 
-                        choices=['train_task_decompose'])
-    
-    parser.add_argument("--prompt-allocation-set", type=str, default="train_task_allocation", 
-                        choices=['train_task_allocation'])
-    
-    parser.add_argument("--test-set", type=str, default="final_test",
-                        choices=['final_test'])
-
-    parser.add_argument("--task-index", type=int, default=None,
-                        help="Process only specific task index (0-based)")
-
-    parser.add_argument("--log-results", type=bool, default=True)
-
-    args = parser.parse_args()
-
-    set_api_key(args.openai_api_key_file)
-    
-    if not os.path.isdir(f"./logs/"):
-        os.makedirs(f"./logs/")
-        
-    # read the tasks        
-    test_tasks = []
-    robots_test_tasks = []  
-    gt_test_tasks = []    
-    trans_cnt_tasks = []
-    max_trans_cnt_tasks = []  
-    with open (f"./data/{args.test_set}/FloorPlan{args.floor_plan}.json", "r") as f:
-        for line in f.readlines():
-            test_tasks.append(list(json.loads(line).values())[0])
-            robots_test_tasks.append(list(json.loads(line).values())[1])
-            gt_test_tasks.append(list(json.loads(line).values())[2])
-            trans_cnt_tasks.append(list(json.loads(line).values())[3])
-            max_trans_cnt_tasks.append(list(json.loads(line).values())[4])
-                    
-    # Filter by task index if specified
-    if args.task_index is not None:
-        if args.task_index < 0 or args.task_index >= len(test_tasks):
-            print(f"Error: task-index {args.task_index} out of range (0-{len(test_tasks)-1})")
-            exit(1)
-
-        # Keep only the specified task
-        test_tasks = [test_tasks[args.task_index]]
-        robots_test_tasks = [robots_test_tasks[args.task_index]]
-        gt_test_tasks = [gt_test_tasks[args.task_index]]
-        trans_cnt_tasks = [trans_cnt_tasks[args.task_index]]
-        max_trans_cnt_tasks = [max_trans_cnt_tasks[args.task_index]]
-        print(f"\n----Filtered to task index {args.task_index}----")
-
-    print(f"\n----Test set tasks----\n{test_tasks}\nTotal: {len(test_tasks)} tasks\n")
-    # prepare list of robots for the tasks
-    available_robots = []
-    for robots_list in robots_test_tasks:
-        task_robots = []
-        for i, r_id in enumerate(robots_list):
-            rob = robots.robots [r_id-1]
-            # rename the robot
-            rob['name'] = 'robot' + str(i+1)
-            task_robots.append(rob)
-        available_robots.append(task_robots)
-        
-    
-    ######## Train Task Decomposition ########
-        
-    # prepare train decompostion demonstration for ai2thor samples
-    prompt = f"from skills import " + actions.ai2thor_actions
-    prompt += f"\nimport time"
-    prompt += f"\nimport threading"
-    objects_ai = f"\n\nobjects = {get_ai2_thor_objects(args.floor_plan)}"
-    prompt += objects_ai
-    
-    # read input train prompts
-    decompose_prompt_file = open(os.getcwd() + "/data/pythonic_plans/" + args.prompt_decompse_set + ".py", "r")
-    decompose_prompt = decompose_prompt_file.read()
-    decompose_prompt_file.close()
-    
-    prompt += "\n\n" + decompose_prompt
-    
-    print ("Generating Decompsed Plans...")
-    
-    decomposed_plan = []
-    for task in test_tasks:
-        curr_prompt =  f"{prompt}\n\n# Task Description: {task}"
+def get_ai2_thor_objects(floor_plan_id, catalog):
+    # read the object list from the precomputed catalog (scripts/object_catalog.py)
+    catalog_objs = catalog_objects(catalog, floor_plan_id)
+    obj = [o["objectType"] for o in catalog_objs]
+    obj_mass = [o["mass"] for o in catalog_objs]
+    return convert_to_dict_objprop(obj, obj_mass)
+
+def ground_truth_objects(tasks):
+    # object list of a floor plan without a catalog: the objects named by its tasks' ground truth
+    names = []
+    for t in tasks:
+        for state in t['ground_truth']:
+            for name in [state['name']] + state['contains']:
+                name = name.strip()
+                if name not in names:
+                    names.append(name)
+    return convert_to_dict_objprop(names, [1.0] * len(names))
+
+def task_folder_name(task, date_time):
+    task_name = "{fxn}".format(fxn = '_'.join(task.split(' ')))
+    task_name = task_name.replace('\n','')
+    return f"{task_name}_plans_{date_time}"
+
+# save generated plan, execute_plan.py reads the robots, floor plan and ground truth back from log.txt
+def write_task_logs(folder_name, task, gpt_version, floor_plan, objects_ai, task_robots, ground_truth, trans, max_trans,
+                    decomposed_plan, allocated_plan, code_plan):
+    # returns the folder written, with a _2, _3... suffix when a run in the same second used the name
+    base_name, n = folder_name, 1
+    while True:
+        try:
+            os.makedirs("./logs/"+folder_name, exist_ok=False)
+            break
+        except FileExistsError:
+            n += 1
+            folder_name = f"{base_name}_{n}"
+
+    with open(f"./logs/{folder_name}/log.txt", 'w') as f:
+        f.write(task)
+        f.write(f"\n\nGPT Version: {gpt_version}")
+        f.write(f"\n\nFloor Plan: {floor_plan}")
+        f.write(f"\n{objects_ai}")
+        f.write(f"\nrobots = {task_robots}")
+        f.write(f"\nground_truth = {ground_truth}")
+        f.write(f"\ntrans = {trans}")
+        f.write(f"\nmax_trans = {max_trans}")
+
+    with open(f"./logs/{folder_name}/decomposed_plan.py", 'w') as d:
+        d.write(decomposed_plan)
+
+    with open(f"./logs/{folder_name}/allocated_plan.py", 'w') as a:
+        a.write(allocated_plan)
+
+    with open(f"./logs/{folder_name}/code_plan.py", 'w') as x:
+        x.write(code_plan)
+    return folder_name
+
+def decompose_task(prompt, task, gpt_version, monitor=None, temperature=0):
+    curr_prompt =  f"{prompt}\n\n# Task Description: {task}"
         
-        if "gpt" not in args.gpt_version:
-            # older gpt versions
-            _, text = LM(curr_prompt, args.gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.15)
-        else:
-            messages = [
-                {"role": "system", "content": """You are a task decomposition expert for robot planning.
+    if "gpt" not in gpt_version:
+        # older gpt versions
+        _, text = LM(curr_prompt, gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.15, temperature=temperature, monitor=monitor, stage='decompose')
+    else:
+        messages = [
+            {"role": "system", "content": """You are a task decomposition expert for robot planning.
 
             CRITICAL OUTPUT FORMAT RULES:
             1. Output MUST be raw Python code only
@@ -185,58 +291,73 @@ if __name__ == "__main__":
             2. Follow the examples provided exactly for similar tasks
 
             Generate task decomposition following the examples provided."""},
-                {"role": "user", "content": curr_prompt}
-            ]
-            _, text = LM(messages,args.gpt_version, max_tokens=1300, frequency_penalty=0.0)
-
-            # Post-processing: markdown 블록 제거
-            if text.startswith("```python"):
-                text = text[len("```python"):].strip()
-            if text.startswith("```"):
-                text = text[3:].strip()
-            if text.endswith("```"):
-                text = text[:-3].strip()
-
-        decomposed_plan.append(text)
-        
-    print ("Generating Allocation Solution...")
+            {"role": "user", "content": curr_prompt}
+        ]
+        _, text = LM(messages,gpt_version, max_tokens=1300, frequency_penalty=0.0, temperature=temperature, monitor=monitor, stage='decompose')
 
-    ######## Train Task Allocation - SOLUTION ########
-    prompt = f"from skills import " + actions.ai2thor_actions
-    prompt += f"\nimport time"
-    prompt += f"\nimport threading"
-    
-    prompt_file = os.getcwd() + "/data/pythonic_plans/" + args.prompt_allocation_set + "_solution.py"
-    allocated_prompt_file = open(prompt_file, "r")
-    allocated_prompt = allocated_prompt_file.read()
-    allocated_prompt_file.close()
-    
-    prompt += "\n\n" + allocated_prompt + "\n\n"
-    
-    allocated_plan = []
-    for i, plan in enumerate(decomposed_plan):
-        no_robot  = len(available_robots[i])
-        curr_prompt = prompt + plan
-        curr_prompt += f"\n\n{'='*80}"
-        curr_prompt += f"\n# ABOVE ARE EXAMPLES ONLY - IGNORE THEM NOW!"
-        curr_prompt += f"\n# YOUR CURRENT TASK: \"{test_tasks[i]}\""
-        curr_prompt += f"\n# Allocate robots for THIS task ONLY (not the examples above)."
-        curr_prompt += f"\n{'='*80}"
-        curr_prompt += f"\n\n# TASK ALLOCATION"
-        curr_prompt += f"\n# Scenario: There are {no_robot} robots available, The task should be performed using the minimum number of robots necessary. Robots should be assigned to subtasks that match its skills and mass capacity. Using your reasoning come up with a solution to satisfy all contraints."
-        curr_prompt += f"\n\nrobots = {available_robots[i]}"
-        curr_prompt += f"\n{objects_ai}"
-        curr_prompt += f"\n\n# IMPORTANT: The AI should ensure that the robots assigned to the tasks have all the necessary skills to perform the tasks. IMPORTANT: Determine whether the subtasks must be performed sequentially or in parallel, or a combination of both and allocate robots based on availablitiy. "
-        curr_prompt += f"\n# SOLUTION  \n"
-
-        if "gpt" not in args.gpt_version:
-            # older versions of GPT
-            _, text = LM(curr_prompt, args.gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.65)
-
-        elif "gpt-3.5" in args.gpt_version:
-            # gpt 3.5 and its variants
-            messages = [
-                {"role": "system", "content": """You are a robot task allocation analyst.
+        # Post-processing: markdown 블록 제거
+        if text.startswith("```python"):
+            text = text[len("```python"):].strip()
+        if text.startswith("```"):
+            text = text[3:].strip()
+        if text.endswith("```"):
+            text = text[:-3].strip()
+
+    return text
+
+def decompose_tasks(prompt, tasks, gpt_version, monitor=None):
+    # several tasks in one request (--batch-decompose), the response has one delimited section per task
+    curr_prompt = batch_prompt(prompt, tasks)
+    messages = [
+        {"role": "system", "content": """You are a task decomposition expert for robot planning.
+
+        CRITICAL OUTPUT FORMAT RULES:
+        1. Output MUST be raw Python code only
+        2. NEVER use markdown code blocks (```python or ```)
+        3. Start the output of every task with its header line (# === TASK n ===), followed by # GENERAL TASK DECOMPOSITION
+        4. Decompose every task independently, never share functions between tasks
+        5. NO text before or after the code
+
+        CRITICAL TASK DECOMPOSITION RULES:
+        1. SLICING OBJECTS REQUIRES A KNIFE:
+           - Before any SliceObject() call, you MUST first:
+             a) GoToObject('Knife')
+             b) PickupObject('Knife')
+           - After slicing, put the Knife down on a surface
+           - Example: To slice tomato → Get Knife → Slice Tomato → Put Knife down
+
+        2. Follow the examples provided exactly for similar tasks
+
+        Generate the task decomposition of every task following the examples provided."""},
+        {"role": "user", "content": curr_prompt}
+    ]
+    max_tokens = min(TASK_MAX_TOKENS * len(tasks), BATCH_MAX_TOKENS)
+    _, text = LM(messages, gpt_version, max_tokens=max_tokens, frequency_penalty=0.0, monitor=monitor, stage='decompose_batch')
+    return text
+
+def allocate_task(prompt, task, plan, task_robots, objects_ai, gpt_version):
+    no_robot  = len(task_robots)
+    curr_prompt = prompt + plan
+    curr_prompt += f"\n\n{'='*80}"
+    curr_prompt += f"\n# ABOVE ARE EXAMPLES ONLY - IGNORE THEM NOW!"
+    curr_prompt += f"\n# YOUR CURRENT TASK: \"{task}\""
+    curr_prompt += f"\n# Allocate robots for THIS task ONLY (not the examples above)."
+    curr_prompt += f"\n{'='*80}"
+    curr_prompt += f"\n\n# TASK ALLOCATION"
+    curr_prompt += f"\n# Scenario: There are {no_robot} robots available, The task should be performed using the minimum number of robots necessary. Robots should be assigned to subtasks that match its skills and mass capacity. Using your reasoning come up with a solution to satisfy all contraints."
+    curr_prompt += f"\n\nrobots = {task_robots}"
+    curr_prompt += f"\n{objects_ai}"
+    curr_prompt += f"\n\n# IMPORTANT: The AI should ensure that the robots assigned to the tasks have all the necessary skills to perform the tasks. IMPORTANT: Determine whether the subtasks must be performed sequentially or in parallel, or a combination of both and allocate robots based on availablitiy. "
+    curr_prompt += f"\n# SOLUTION  \n"
+
+    if "gpt" not in gpt_version:
+        # older versions of GPT
+        _, text = LM(curr_prompt, gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.65, stage='allocate')
+
+    elif "gpt-3.5" in gpt_version:
+        # gpt 3.5 and its variants
+        messages = [
+            {"role": "system", "content": """You are a robot task allocation analyst.
 
         CRITICAL: You are given examples followed by a NEW task. You MUST allocate robots for the NEW task ONLY.
         DO NOT confuse the NEW task with the examples!
@@ -293,14 +414,14 @@ if __name__ == "__main__":
         - DO NOT confuse example tasks with the current task
         - DO NOT use objects not mentioned in the current task
         - DO NOT assign same sequential actions to different robots"""},
-                {"role": "user", "content": curr_prompt}
-            ]
-            _, text = LM(messages, args.gpt_version, max_tokens=1500, frequency_penalty=0.35)
+            {"role": "user", "content": curr_prompt}
+        ]
+        _, text = LM(messages, gpt_version, max_tokens=1500, frequency_penalty=0.35, stage='allocate')
 
-        else:
-            # gpt 4.0
-            messages = [
-                {"role": "system", "content": """You are a Robot Task Allocation Expert.
+    else:
+        # gpt 4.0
+        messages = [
+            {"role": "system", "content": """You are a Robot Task Allocation Expert.
 
         CRITICAL OUTPUT FORMAT RULES:
         1. Output plain text analysis only - NO markdown
@@ -330,58 +451,44 @@ if __name__ == "__main__":
         3. All team members must have compatible skills
 
         Determine whether the subtasks must be performed sequentially or in parallel based on reasoning."""},
-                {"role": "system", "content": "You are a Robot Task Allocation Expert"},
-                {"role": "user", "content": curr_prompt}
-            ]
-            _, text = LM(messages, args.gpt_version, max_tokens=500, frequency_penalty=0.69)
-
-        # Post-processing: markdown 블록 제거
-        if text.startswith("```python"):
-            text = text[len("```python"):].strip()
-        if text.startswith("```"):
-            text = text[3:].strip()
-        if text.endswith("```"):
-            text = text[:-3].strip()
-
-        allocated_plan.append(text)
-    
-    print ("Generating Allocated Code...")
-    
-    ######## Train Task Allocation - CODE Solution ########
-
-    prompt = f"from skills import " + actions.ai2thor_actions
-    prompt += f"\nimport time"
-    prompt += f"\nimport threading"
-    prompt += objects_ai
-    
-    code_plan = []
-
-    prompt_file1 = os.getcwd() + "/data/pythonic_plans/" + args.prompt_allocation_set + "_code.py"
-    code_prompt_file = open(prompt_file1, "r")
-    code_prompt = code_prompt_file.read()
-    code_prompt_file.close()
-    
-    prompt += "\n\n" + code_prompt + "\n\n"
-
-    for i, (plan, solution) in enumerate(zip(decomposed_plan,allocated_plan)):
-        curr_prompt = prompt + plan # Stage 1 결과 
-        curr_prompt += f"\n# TASK ALLOCATION"
-        curr_prompt += f"\n\nrobots = {available_robots[i]}"
-        curr_prompt += solution
-        curr_prompt += f"\n# CODE Solution  \n"
+            {"role": "system", "content": "You are a Robot Task Allocation Expert"},
+            {"role": "user", "content": curr_prompt}
+        ]
+        _, text = LM(messages, gpt_version, max_tokens=500, frequency_penalty=0.69, stage='allocate')
+
+    # Post-processing: markdown 블록 제거
+    if text.startswith("```python"):
+        text = text[len("```python"):].strip()
+    if text.startswith("```"):
+        text = text[3:].strip()
+    if text.endswith("```"):
+        text = text[:-3].strip()
+
+    return text
+
+def generate_code(prompt, plan, solution, task_robots, gpt_version, monitor=None, feedback=None, temperature=0):
+    # feedback: issues found in a previous attempt, asks for a corrected plan
+    # temperature: sampling temperature, raised for the extra candidates of --n-best
+    curr_prompt = prompt + plan # Stage 1 결과 
+    curr_prompt += f"\n# TASK ALLOCATION"
+    curr_prompt += f"\n\nrobots = {task_robots}"
+    curr_prompt += solution
+    if feedback:
+        curr_prompt += f"\n# A PREVIOUS CODE SOLUTION WAS REJECTED: " + "; ".join(feedback)
+        curr_prompt += f"\n# Fix these problems in the new CODE Solution."
+    curr_prompt += f"\n# CODE Solution  \n"
         
-        if "gpt" not in args.gpt_version:
-            # older versions of GPT
-            _, text = LM(curr_prompt, args.gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.30)
-        elif "gpt-3.5" in args.gpt_version:
-            # gpt-3.5: needs simpler, more explicit prompts
+    if "gpt" not in gpt_version:
+        # older versions of GPT
+        _, text = LM(curr_prompt, gpt_version, max_tokens=1000, stop=["def"], frequency_penalty=0.30, temperature=temperature, monitor=monitor, stage='code')
+    elif "gpt-3.5" in gpt_version:
+        # gpt-3.5: needs simpler, more explicit prompts
 
-            # Extract all function definitions from decomposed plan
-            import re
-            function_defs = re.findall(r'def\s+(\w+)\(', plan)
+        # Extract all function definitions from decomposed plan
+        function_defs = re.findall(r'def\s+(\w+)\(', plan)
 
-            messages = [
-                {"role": "system", "content": f"""You are a Python code generator for robot tasks.
+        messages = [
+            {"role": "system", "content": f"""You are a Python code generator for robot tasks.
 
             CRITICAL WARNING - DO NOT COPY TRAINING EXAMPLES:
             You will see training examples (wash_fork, put_tomato, slice_potato, pick_up_fork).
@@ -537,13 +644,13 @@ if __name__ == "__main__":
             Generate code ONLY for the task in the "# TASK ALLOCATION" section below.
             The task name and robots are specified there.
             DO NOT generate code for wash_fork, put_tomato_in_fridge, slice_potato, or pick_up_fork examples!"""},
-                {"role": "user", "content": curr_prompt + f"\n\n{'='*80}\n# ABOVE ARE EXAMPLES - IGNORE THEM\n# GENERATE CODE FOR THIS TASK ONLY:\n{'='*80}\n\n# Generate Python code for the task in TASK ALLOCATION section.\n# Include ALL {len(function_defs)} functions AND their function calls:\n"}
-            ]
-            _, text = LM(messages, args.gpt_version, max_tokens=1000, frequency_penalty=0.5)
-        else:
-            # using gpt-4 or other advanced models
-            messages = [
-                {"role": "system", "content": """You are a Python code generator for multi-robot task allocation.
+            {"role": "user", "content": curr_prompt + f"\n\n{'='*80}\n# ABOVE ARE EXAMPLES - IGNORE THEM\n# GENERATE CODE FOR THIS TASK ONLY:\n{'='*80}\n\n# Generate Python code for the task in TASK ALLOCATION section.\n# Include ALL {len(function_defs)} functions AND their function calls:\n"}
+        ]
+        _, text = LM(messages, gpt_version, max_tokens=1000, frequency_penalty=0.5, temperature=temperature, monitor=monitor, stage='code')
+    else:
+        # using gpt-4 or other advanced models
+        messages = [
+            {"role": "system", "content": """You are a Python code generator for multi-robot task allocation.
 
             CRITICAL OUTPUT FORMAT RULES:
             1. Output MUST start directly with Python code (def or function calls)
@@ -638,51 +745,507 @@ if __name__ == "__main__":
             - Different robots for pickup and put/throw of same object
             - SliceObject without getting Knife first
             - Sequential tasks split across multiple robots"""},
-                {"role": "user", "content": curr_prompt + "\n\n# CODE Solution (output raw Python code only, NO markdown blocks):\n"}
-            ]
-            _, text = LM(messages, args.gpt_version, max_tokens=1400, frequency_penalty=0.4)
-
-            # Post-processing: markdown 블록 제거 (만약 LLM이 여전히 생성한다면)
-            if text.startswith("```python"):
-                text = text[len("```python"):].strip()
-            if text.startswith("```"):
-                text = text[3:].strip()
-            if text.endswith("```"):
-                text = text[:-3].strip()
-
-        code_plan.append(text)
+            {"role": "user", "content": curr_prompt + "\n\n# CODE Solution (output raw Python code only, NO markdown blocks):\n"}
+        ]
+        _, text = LM(messages, gpt_version, max_tokens=1400, frequency_penalty=0.4, temperature=temperature, monitor=monitor, stage='code')
+
+        # Post-processing: markdown 블록 제거 (만약 LLM이 여전히 생성한다면)
+        if text.startswith("```python"):
+            text = text[len("```python"):].strip()
+        if text.startswith("```"):
+            text = text[3:].strip()
+        if text.endswith("```"):
+            text = text[:-3].strip()
+
+    return text
+
+def parse_floor_plans(values, test_set):
+    # "all" selects every FloorPlan<N>.json of the test set
+    if "all" in values:
+        return list_floor_plans(test_set)
+    return [int(v) for v in values]
+
+def load_floor_plan_tasks(test_set, floor_plan, task_index=None):
+    # read the tasks
+    tasks = []
+    with open (f"./data/{test_set}/FloorPlan{floor_plan}.json", "r") as f:
+        for line in f.readlines():
+            values = list(json.loads(line).values())
+            tasks.append({'floor_plan': floor_plan, 'task': values[0], 'robot_ids': values[1],
+                          'ground_truth': values[2], 'trans': values[3], 'max_trans': values[4]})
+
+    # Filter by task index if specified
+    if task_index is not None:
+        if task_index < 0 or task_index >= len(tasks):
+            print(f"Error: task-index {task_index} out of range (0-{len(tasks)-1})")
+            exit(1)
+
+        # Keep only the specified task
+        tasks = [tasks[task_index]]
+        print(f"\n----Filtered to task index {task_index}----")
+    return tasks
+
+def prepare_robots(robots_list, fleet):
+    # prepare list of robots for the task
+    task_robots = []
+    for i, r_id in enumerate(robots_list):
+        # fleet robots are immutable, the task gets a renamed copy
+        rob = fleet[r_id-1].renamed('robot' + str(i+1))
+        task_robots.append(rob.as_dict())
+    return task_robots
+
+def read_prompt_file(name):
+    with open(os.getcwd() + "/data/pythonic_plans/" + name + ".py", "r") as f:
+        return f.read()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--floor-plan", type=str, nargs="+", required=True,
+                        help="One or more floor plan numbers, or 'all' for every floor plan in the test set")
+    parser.add_argument("--openai-api-key-file", type=str, default="api_key")
+    parser.add_argument("--gpt-version", type=str, default="gpt-4", 
+                        choices=['gpt-3.5-turbo', 'gpt-4', 'gpt-3.5-turbo-16k'])
     
-    # save generated plan
-    exec_folders = []
-    if args.log_results:
-        line = {}
-        now = datetime.now() # current date and time
-        date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
-        
-        for idx, task in enumerate(test_tasks):
-            task_name = "{fxn}".format(fxn = '_'.join(task.split(' ')))
-            task_name = task_name.replace('\n','')
-            folder_name = f"{task_name}_plans_{date_time}"
-            exec_folders.append(folder_name)
-            
-            os.mkdir("./logs/"+folder_name)
-     
-            with open(f"./logs/{folder_name}/log.txt", 'w') as f:
-                f.write(task)
-                f.write(f"\n\nGPT Version: {args.gpt_version}")
-                f.write(f"\n\nFloor Plan: {args.floor_plan}")
-                f.write(f"\n{objects_ai}")
-                f.write(f"\nrobots = {available_robots[idx]}")
-                f.write(f"\nground_truth = {gt_test_tasks[idx]}")
-                f.write(f"\ntrans = {trans_cnt_tasks[idx]}")
-                f.write(f"\nmax_trans = {max_trans_cnt_tasks[idx]}")
-
-            with open(f"./logs/{folder_name}/decomposed_plan.py", 'w') as d:
-                d.write(decomposed_plan[idx])
-                
-            with open(f"./logs/{folder_name}/allocated_plan.py", 'w') as a:
-                a.write(allocated_plan[idx])
-                
-            with open(f"./logs/{folder_name}/code_plan.py", 'w') as x:
-                x.write(code_plan[idx])
-            
\ No newline at end of file
+    parser.add_argument("--prompt-decompse-set", type=str, default="train_task_decompose", 
+                        choices=['train_task_decompose'])
+    
+    parser.add_argument("--prompt-allocation-set", type=str, default="train_task_allocation", 
+                        choices=['train_task_allocation'])
+    
+    parser.add_argument("--test-set", type=str, default="final_test",
+                        choices=['final_test'])
+
+    parser.add_argument("--task-index", type=int, default=None,
+                        help="Process only specific task index (0-based)")
+
+    parser.add_argument("--log-results", type=bool, default=True)
+
+    parser.add_argument("--cache-dir", type=str, default=".llm_cache",
+                        help="Directory of the on-disk LLM response cache")
+    parser.add_argument("--cache-max-mb", type=int, default=512,
+                        help="Size limit of the response cache, least recently used entries are evicted first")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the response cache and always call the API")
+
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="Number of tasks run at the same time, and of requests in flight (--n-best candidates included)")
+    parser.add_argument("--rpm", type=int, default=None,
+                        help="Requests per minute limit (unlimited by default)")
+    parser.add_argument("--tpm", type=int, default=None,
+                        help="Tokens per minute limit (unlimited by default)")
+
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries of an API call failing with a transient error (rate limit, timeout, 5xx)")
+    parser.add_argument("--retry-base-delay", type=float, default=1.0,
+                        help="First retry backoff in seconds, doubled on every retry (with jitter) unless the server sends retry-after")
+    parser.add_argument("--retry-max-delay", type=float, default=60.0,
+                        help="Upper bound of the retry backoff in seconds")
+    parser.add_argument("--breaker-cooldown", type=float, default=30.0,
+                        help="Seconds all API calls pause when most recent calls failed (circuit breaker)")
+
+    parser.add_argument("--fleet", type=str, default=None,
+                        help="JSON file of the robots the robot ids of the test set refer to (resources/robots.py by default)")
+
+    parser.add_argument("--object-catalog", type=str, default=DEFAULT_CATALOG,
+                        help="Precomputed scene objects (scripts/object_catalog.py)")
+    parser.add_argument("--build-catalog", action="store_true",
+                        help="Start AI2-THOR to add the floor plans missing from the object catalog (or rebuild a stale one)")
+    parser.add_argument("--object-context", type=str, default="full", choices=CONTEXT_MODES,
+                        help="Objects listed in the prompts: every scene object (full), duplicates collapsed and masses rounded (compact), "
+                             "or only objects related to the task plus common receptacles (relevant)")
+    parser.add_argument("--report-context-savings", action="store_true",
+                        help="Print the prompt tokens saved per task by --object-context")
+    parser.add_argument("--few-shot-k", type=int, default=None,
+                        help="Use only the k training examples most similar to the task in each prompt (all examples by default)")
+    parser.add_argument("--few-shot-token-budget", type=int, default=None,
+                        help="Approximate token budget for the training examples of each prompt")
+    parser.add_argument("--batch-decompose", type=int, default=1,
+                        help="Decompose up to N tasks of the same floor plan in one request, tasks whose section of the "
+                             "response is unusable are decomposed on their own (gpt models only)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream the decomposition and code completions and cancel them as soon as the plan is clearly unusable")
+
+    parser.add_argument("--allocation", type=str, default="llm", choices=['llm', 'solver'],
+                        help="Allocate robots to subtasks with the LLM, or with the deterministic skill and mass "
+                             "capacity solver (the LLM is used when the solver finds no team for a subtask)")
+    parser.add_argument("--codegen", type=str, default="llm", choices=['llm', 'template'],
+                        help="Write the code plans with the LLM, or fill the decomposed plan with the robots of the solver "
+                             "allocation (needs --allocation solver, the LLM is used when the plan cannot be mapped)")
+    parser.add_argument("--travel-costs-dir", type=str, default=DEFAULT_TRAVEL_COSTS_DIR,
+                        help="Precomputed travel distances (scripts/travel_costs.py), used by the allocation solver "
+                             "to prefer the teams that walk the least")
+
+    parser.add_argument("--cascade-model", type=str, default=None, choices=['gpt-3.5-turbo', 'gpt-4', 'gpt-3.5-turbo-16k'],
+                        help="Generate every stage with this cheaper model first, and only with --gpt-version when its output fails the checks")
+
+    parser.add_argument("--n-best", type=int, default=1,
+                        help="Candidates requested at once for the decomposition and code stages, at increasing temperatures; "
+                             "the first one passing the checks is used and the others are cancelled")
+    parser.add_argument("--n-best-temperature-step", type=float, default=0.3,
+                        help="Temperature added for each extra --n-best candidate (the first one uses 0)")
+
+    parser.add_argument("--plan-retries", type=int, default=2,
+                        help="Times a code plan rejected by the static validator is regenerated before the task fails")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="Skip the static validation of the generated code plans")
+
+    parser.add_argument("--resume", action="store_true",
+                        help="Reuse the stage outputs saved by a previous run when their inputs did not change, "
+                             "and skip tasks whose logs folder was already written")
+    parser.add_argument("--checkpoint-dir", type=str, default=DEFAULT_CHECKPOINT_DIR,
+                        help="Directory of the per-task stage checkpoints")
+
+    parser.add_argument("--backend", type=str, default="openai", choices=BACKENDS,
+                        help="Where completions come from: the OpenAI API, the API while saving every response (record), "
+                             "saved responses without network access (replay), or canned plans (synthetic)")
+    parser.add_argument("--backend-dir", type=str, default=DEFAULT_BACKEND_DIR,
+                        help="Directory of the recorded responses for --backend record/replay")
+    parser.add_argument("--replay-latency", type=str, default="none",
+                        help="Latency added to replayed and synthetic responses: none, recorded, fixed:S, uniform:MIN,MAX or lognormal:MEDIAN,SIGMA")
+
+    args = parser.parse_args()
+
+    floor_plans = parse_floor_plans(args.floor_plan, args.test_set)
+    if args.task_index is not None and len(floor_plans) > 1:
+        print("Error: --task-index can only be used with a single floor plan")
+        exit(1)
+    if args.codegen == 'template' and args.allocation != 'solver':
+        print("Error: --codegen template needs the robots allocated by --allocation solver")
+        exit(1)
+
+    backend = make_backend(args.backend, args.backend_dir, args.replay_latency)
+    if args.backend in ('openai', 'record'):
+        set_api_key(args.openai_api_key_file)
+    # offline backends are their own response store, and a recording has to see every request
+    use_cache = args.backend == 'openai' and not args.no_cache
+    llm_cache = LLMCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024, enabled=use_cache)
+    telemetry = Telemetry(args.backend)
+    checkpoints = CheckpointStore(args.checkpoint_dir, resume=args.resume)
+    rate_limiter = RateLimiter(args.rpm, args.tpm)
+    request_slots = ConcurrencyLimit(args.max_concurrency)
+    retry_policy = RetryPolicy(args.max_retries, args.retry_base_delay, args.retry_max_delay,
+                               breaker=CircuitBreaker(cooldown=args.breaker_cooldown))
+    speculator = Speculator(args.n_best, args.n_best_temperature_step, telemetry)
+    cascade = Cascade([args.cascade_model, args.gpt_version], log) if args.cascade_model else None
+    # a cascaded run does not reuse the stage outputs of a single-model run
+    cascade_key = [args.cascade_model] if args.cascade_model else []
+    stream_responses = args.stream
+    
+    if not os.path.isdir(f"./logs/"):
+        os.makedirs(f"./logs/")
+
+    fleet = load_fleet(args.fleet) if args.fleet else robots.robots
+    test_tasks = []
+    for floor_plan in floor_plans:
+        test_tasks += load_floor_plan_tasks(args.test_set, floor_plan, args.task_index)
+    for t in test_tasks:
+        if max(t['robot_ids']) > len(fleet):
+            print(f"Error: task '{t['task']}' uses robot {max(t['robot_ids'])} but the fleet only has {len(fleet)} robots")
+            exit(1)
+        t['robots'] = prepare_robots(t['robot_ids'], fleet)
+
+    print(f"\n----Test set tasks----\n{[t['task'] for t in test_tasks]}\nTotal: {len(test_tasks)} tasks in floor plans {floor_plans}\n")
+
+    # read input train prompts once, they are shared by every floor plan
+    header = f"from skills import " + actions.ai2thor_actions
+    header += f"\nimport time"
+    header += f"\nimport threading"
+    decompose_examples = ExampleIndex(read_prompt_file(args.prompt_decompse_set))
+    allocation_examples = ExampleIndex(read_prompt_file(args.prompt_allocation_set + "_solution"))
+    code_examples = ExampleIndex(read_prompt_file(args.prompt_allocation_set + "_code"))
+    few_shot = dict(k=args.few_shot_k, token_budget=args.few_shot_token_budget)
+    example_fns = set()
+    for examples in (decompose_examples, allocation_examples, code_examples):
+        example_fns |= example_function_names(examples.text)
+
+    catalog = load_catalog(args.object_catalog)
+    missing = [floor_plan for floor_plan in floor_plans if catalog_objects(catalog, floor_plan) is None]
+    if missing and args.build_catalog:
+        try:
+            catalog = build_catalog(missing, args.object_catalog)
+        except ImportError:
+            print("Error: --build-catalog needs AI2-THOR (pip install ai2thor)")
+            exit(1)
+        missing = [floor_plan for floor_plan in floor_plans if catalog_objects(catalog, floor_plan) is None]
+    if missing:
+        reason = "was built with another AI2-THOR version" if catalog is not None and is_stale(catalog) \
+            else f"has no floor plans {missing}" if catalog is not None else "does not exist"
+        if args.backend not in ('synthetic', 'replay'):
+            print(f"Error: the object catalog {args.object_catalog} {reason}. Run with --build-catalog first, "
+                  f"or build it with: python3 scripts/object_catalog.py --floor-plan all")
+            exit(1)
+        # offline runs need no simulator, the prompts then list the ground-truth objects only
+        print(f"Warning: the object catalog {args.object_catalog} {reason}, the objects of floor plans {missing} "
+              f"are taken from the ground truth of their tasks")
+    scene_objects = {floor_plan: get_ai2_thor_objects(floor_plan, catalog) if floor_plan not in missing
+                     else ground_truth_objects([t for t in test_tasks if t['floor_plan'] == floor_plan])
+                     for floor_plan in floor_plans}
+    travel_costs = {}
+    if args.allocation == 'solver':
+        travel_costs = {floor_plan: load_travel_costs(floor_plan, args.travel_costs_dir) for floor_plan in floor_plans}
+        missing = [fp for fp, costs in travel_costs.items() if costs is None]
+        if missing:
+            print (f"No travel costs for floor plans {missing}, robots are allocated on skills and mass alone")
+
+    for t in test_tasks:
+        t['objects_ai'] = build_objects_context(scene_objects[t['floor_plan']], t['task'], args.object_context)
+        if args.report_context_savings:
+            full, selected = context_savings(scene_objects[t['floor_plan']], t['task'], args.object_context)
+            # the objects block goes into all three stage prompts
+            print (f"[FloorPlan{t['floor_plan']}] {t['task']}: objects block {full} -> {selected} tokens "
+                   f"({100 * (1 - selected / full):.0f}% less, ~{3 * (full - selected)} tokens saved per task)")
+
+    now = datetime.now() # current date and time
+    date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
+
+    # every task moves through decompose -> allocate -> code on its own and writes
+    # its logs folder as soon as it is done, so a slow task does not hold up the others
+    # tasks sharing a floor plan and objects block are decomposed together with --batch-decompose
+    decomposer = None
+    if args.batch_decompose > 1 and "gpt" in args.gpt_version:
+        groups = {}
+        for idx, t in enumerate(test_tasks):
+            groups.setdefault((t['floor_plan'], t['objects_ai']), []).append(idx)
+        n = args.batch_decompose
+        batches = [g[i:i + n] for g in groups.values() for i in range(0, len(g), n)]
+        # with --cascade-model the batch goes to the cheaper model, a task whose section is
+        # rejected is decomposed on its own and escalated from there
+        batch_model = cascade.models[0] if cascade is not None else args.gpt_version
+
+        def decompose_batch(batch):
+            # {task index: decomposition} for the usable sections of the batch response
+            tasks = [test_tasks[i]['task'] for i in batch]
+            prompt = header + test_tasks[batch[0]]['objects_ai'] + "\n\n" + decompose_examples.render(" ".join(tasks), **few_shot)
+            monitor = PlanMonitor(" ".join(tasks), actions.ai2thor_skills, example_fns)
+            try:
+                text = decompose_tasks(prompt, tasks, batch_model, monitor)
+            except Exception as e:
+                log(f"Batched decomposition of tasks {list(batch)} failed, decomposing them one by one ({type(e).__name__}: {e})")
+                return {}
+            sections = split_sections(text, len(batch))
+            return {idx: sections[n] for n, idx in enumerate(batch, 1)
+                    if valid_section(sections.get(n), test_tasks[idx]['task'], actions.ai2thor_skills, example_fns)}
+
+        decomposer = BatchDecomposer([b for b in batches if len(b) > 1], decompose_batch)
+
+    def checkpointed(t, stage, inputs, produce, valid=None):
+        # stage output saved by a previous run with the same inputs (--resume), otherwise produced and saved
+        key = inputs_key(*inputs)
+        output = checkpoints.load(t['floor_plan'], t['task'], args.gpt_version, stage, key, valid)
+        if output is None:
+            output = produce()
+            checkpoints.save(t['floor_plan'], t['task'], args.gpt_version, stage, key, output)
+        return output
+
+    def candidate_monitor(monitor, cancel):
+        # monitor of an --n-best candidate, stopped once another candidate is accepted
+        return monitor.cancellable(cancel) if cancel is not None else monitor
+
+    def discarding_rejected(generate, validate, bypass=False):
+        # (generate, validate) that drop the cached responses of an output validate() rejects,
+        # so a retry or a later run asks the LLM again instead of replaying the bad output;
+        # bypass: generate without reading the cache at all
+        responses = {}
+        def tracked_generate(*args):
+            with llm_cache.tracking(bypass) as keys:
+                output = generate(*args)
+            responses[output] = keys
+            return output
+        def tracked_validate(output):
+            issues = validate(output)
+            if issues:
+                llm_cache.discard(responses.get(output, ()))
+            return issues
+        return tracked_generate, tracked_validate
+
+    def cascaded(idx, stage, generate, validate):
+        # generate(model, strongest) with the cascade models, or with --gpt-version alone
+        if cascade is None:
+            return generate(args.gpt_version, True)
+        return cascade.run(stage, *discarding_rejected(generate, validate), label=f"[{idx}] ")
+
+    def validated_code(idx, code_prompt, plan, solution, monitor, model=None, retries=None):
+        # model: --gpt-version by default, retries: --plan-retries by default
+        model = model or args.gpt_version
+        retries = args.plan_retries if retries is None else retries
+        t = test_tasks[idx]
+        object_names = [o['name'] for o in scene_objects[t['floor_plan']]]
+
+        ######## Static validation of the CODE Solution ########
+        def check(code):
+            if args.no_validate:
+                return []
+            stage_start = time.time()
+            issues = validate_plan(code, t['robots'], object_names, actions.ai2thor_skills, example_fns, t['task'])
+            t['stage_times']['validate'] = t['stage_times'].get('validate', 0.0) + time.time() - stage_start
+            return issues
+
+        feedback = None
+        for attempt in range(retries + 1):
+            stage_start = time.time()
+            validate_time = t['stage_times'].get('validate', 0.0)
+            code, issues = speculator.first_valid(*discarding_rejected(
+                lambda temperature, cancel: generate_code(code_prompt, plan, solution, t['robots'], model,
+                                                          candidate_monitor(monitor, cancel), feedback, temperature),
+                check, bypass=attempt > 0))
+            t['stage_times']['code'] = (t['stage_times'].get('code', 0.0) + time.time() - stage_start
+                                        - (t['stage_times'].get('validate', 0.0) - validate_time))
+            if not issues:
+                return code
+            if attempt == retries:
+                raise PlanValidationError(issues)
+            log(f"[{idx}] Code plan rejected, regenerating: {'; '.join(issues)}")
+            feedback = issues
+
+    def templated_code(idx, plan, solution):
+        # code plan filled in from the solver allocation, None when the LLM has to write it
+        t = test_tasks[idx]
+        objects = scene_objects[t['floor_plan']]
+        stage_start = time.time()
+        try:
+            allocation = solve_allocation(plan, t['robots'], objects, actions.ai2thor_skills, travel_costs.get(t['floor_plan']))
+            if allocation.text() != solution:
+                raise TemplateError("the robots were not allocated by the solver")
+            code = generate_allocated_code(plan, allocation, t['robots'], objects, actions.ai2thor_skills, t['task'])
+        except (AllocationError, TemplateError) as e:
+            log(f"[{idx}] Code template not applicable, asking the LLM ({e})")
+            return None
+        finally:
+            t['stage_times']['code'] = t['stage_times'].get('code', 0.0) + time.time() - stage_start
+        if not args.no_validate:
+            stage_start = time.time()
+            issues = validate_plan(code, t['robots'], [o['name'] for o in objects], actions.ai2thor_skills, example_fns, t['task'])
+            t['stage_times']['validate'] = t['stage_times'].get('validate', 0.0) + time.time() - stage_start
+            if issues:
+                log(f"[{idx}] Templated code plan rejected, asking the LLM: {'; '.join(issues)}")
+                return None
+        return code
+
+    def generate_task(idx):
+        t = test_tasks[idx]
+        task = t['task']
+        objects_ai = t['objects_ai']
+        monitor = PlanMonitor(task, actions.ai2thor_skills, example_fns)
+        t['stage_times'] = {}
+        start = time.time()
+        try:
+            ######## Train Task Decomposition ########
+            decompose_prompt = header + objects_ai + "\n\n" + decompose_examples.render(task, **few_shot)
+            def decompose():
+                plan = decomposer.get(idx) if decomposer is not None else None
+                if plan:
+                    if cascade is not None:
+                        cascade.record('decompose', 0)
+                    return plan
+                def decompose_with(model, strongest):
+                    plan, _ = speculator.first_valid(*discarding_rejected(
+                        lambda temperature, cancel: decompose_task(decompose_prompt, task, model,
+                                                                   candidate_monitor(monitor, cancel), temperature),
+                        lambda text: plan_issues(text, monitor)))
+                    return plan
+                return cascaded(idx, 'decompose', decompose_with, lambda plan: plan_issues(plan, monitor))
+            plan = checkpointed(t, 'decompose', [decompose_prompt] + cascade_key, decompose)
+            t['stage_times']['decompose'] = time.time() - start
+            log(f"[{idx}] Decomposed: {task}")
+
+            ######## Train Task Allocation - SOLUTION ########
+            stage_start = time.time()
+            allocation_prompt = header + "\n\n" + allocation_examples.render(task, **few_shot) + "\n\n"
+            def allocate():
+                if args.allocation == 'solver':
+                    try:
+                        return solve_allocation(plan, t['robots'], scene_objects[t['floor_plan']], actions.ai2thor_skills,
+                                                travel_costs.get(t['floor_plan'])).text()
+                    except AllocationError as e:
+                        log(f"[{idx}] Allocation solver failed, asking the LLM ({e})")
+                return cascaded(idx, 'allocate',
+                                lambda model, strongest: allocate_task(allocation_prompt, task, plan, t['robots'], objects_ai, model),
+                                lambda text: allocation_issues(text, t['robots']))
+            solution = checkpointed(t, 'allocate', [allocation_prompt, plan, t['robots'], objects_ai, args.allocation,
+                                                     travel_costs.get(t['floor_plan']) is not None] + cascade_key, allocate)
+            t['stage_times']['allocate'] = time.time() - stage_start
+            log(f"[{idx}] Allocated: {task}")
+
+            ######## Train Task Allocation - CODE Solution ########
+            code_prompt = header + objects_ai + "\n\n" + code_examples.render(task, **few_shot) + "\n\n"
+            def write_code():
+                code = templated_code(idx, plan, solution) if args.codegen == 'template' else None
+                if code:
+                    return code
+                # the cheaper model gets no regeneration, a rejected plan escalates right away
+                return cascaded(idx, 'code',
+                                lambda model, strongest: validated_code(idx, code_prompt, plan, solution, monitor, model,
+                                                                        None if strongest else 0),
+                                lambda code: [])
+            code = checkpointed(t, 'code', [code_prompt, plan, solution, t['robots'], not args.no_validate, args.codegen] + cascade_key,
+                                write_code)
+
+            folder_name = None
+            stage_start = time.time()
+            if args.log_results:
+                def write_logs():
+                    return write_task_logs(task_folder_name(task, date_time), task, args.gpt_version, t['floor_plan'],
+                                           objects_ai, t['robots'], t['ground_truth'], t['trans'], t['max_trans'],
+                                           plan, solution, code)
+                # a task whose logs folder is complete is not written again
+                folder_name = checkpointed(t, 'logs', [plan, solution, code], write_logs,
+                                           valid=lambda folder: os.path.isfile(f"./logs/{folder}/code_plan.py"))
+            t['stage_times']['logs'] = time.time() - stage_start
+        except Exception as e:
+            log(f"[{idx}] FAILED: {task} ({type(e).__name__}: {e})")
+            return None
+        t['folder_name'] = folder_name
+        t['elapsed'] = time.time() - start
+        log(f"[{idx}] Done in {t['elapsed']:.1f}s: {task}")
+        return folder_name or task
+
+    def run_task(idx):
+        # LLM calls of the task are written next to its plans
+        t = test_tasks[idx]
+        with telemetry.task(task=t['task'], floor_plan=t['floor_plan']) as calls:
+            result = generate_task(idx)
+        # a task resumed from its checkpoints made no calls, its folder keeps the telemetry of the earlier run
+        if result is not None and t['folder_name'] is not None and calls:
+            write_jsonl(f"./logs/{t['folder_name']}/{TELEMETRY_FILE}", calls)
+        return result
+
+    print ("Generating Plans...")
+    start = time.time()
+    exec_folders = dispatch(run_task, range(len(test_tasks)), max_workers=args.max_concurrency)
+    speculator.join()
+
+    print ("\n========== Summary ==========")
+    failed = []
+    for floor_plan in floor_plans:
+        fp_tasks = [(t, folder) for t, folder in zip(test_tasks, exec_folders) if t['floor_plan'] == floor_plan]
+        done = [t for t, folder in fp_tasks if folder is not None]
+        slowest = max([t['elapsed'] for t in done], default=0.0)
+        print (f"FloorPlan {floor_plan}: {len(done)}/{len(fp_tasks)} tasks generated (slowest task {slowest:.1f}s)")
+        for t, folder in fp_tasks:
+            if folder is None:
+                print (f"  FAILED: {t['task']}")
+                failed.append(t)
+    print (f"Generated {len(test_tasks) - len(failed)}/{len(test_tasks)} tasks in {time.time() - start:.1f}s")
+    # wall time spent in each stage, summed over tasks (tasks overlap when run concurrently)
+    for stage in ('decompose', 'allocate', 'code', 'validate', 'logs'):
+        times = [t['stage_times'][stage] for t in test_tasks if stage in t.get('stage_times', {})]
+        if times:
+            print (f"Stage {stage}: {sum(times):.2f}s total, {sum(times) / len(times):.3f}s mean, {max(times):.3f}s max over {len(times)} tasks")
+    print (llm_cache.summary())
+    print (checkpoints.summary())
+    print (retry_policy.summary())
+    print (rate_limiter.summary())
+    print (request_slots.summary())
+    if decomposer is not None:
+        print (decomposer.summary())
+    if args.n_best > 1:
+        print (speculator.summary())
+    if cascade is not None:
+        print (cascade.summary())
+    print (telemetry.summary())
+    if backend.summary() is not None:
+        print (backend.summary())
+    if stream_responses:
+        print (stream_stats.summary())
+    if failed:
+        exit(1)
@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from llm_stream import GenerationAborted
+
+
+# Speculative n-best generation (--n-best K). A stage sends K requests at once, the
+# first at the usual temperature 0 and the others at increasing temperatures, and checks
+# each candidate as soon as it is complete. The first candidate without issues is used
+# and the others are cancelled: candidates not sent yet (waiting for a request slot of
+# --max-concurrency or for the rate limiter) are not sent, streamed candidates stop at
+# their next chunk, and requests already sent without streaming finish in the background
+# and are ignored. Every candidate goes through LM(), so cancelled ones are recorded as
+# 'cancelled' in the telemetry, not as errors. A bad plan then costs the extra tokens of
+# K-1 candidates instead of a retry of the whole floor plan.
+
+
+def plan_issues(text, monitor):
+    # symbolic checks of a decomposed plan, the same as the streaming checks
+    if "def " not in text:
+        return ["the plan defines no subtask function"]
+    monitor = monitor.fresh()
+    try:
+        monitor.feed(text)
+        monitor.finish()
+    except GenerationAborted as e:
+        return [e.reason]
+    return []
+
+
+class Speculator:
+    def __init__(self, n=1, temperature_step=0.3, telemetry=None):
+        self.temperatures = [round(i * temperature_step, 2) for i in range(n)]
+        self.telemetry = telemetry
+        self.runs = 0
+        self.candidates = 0
+        self.accepted = [0] * n
+        self.rejected = 0
+        self.unresolved = 0
+        self._pools = []
+        self._lock = threading.Lock()
+
+    def first_valid(self, generate, validate):
+        # (text, issues) of the first candidate without issues, or of the candidate with the
+        # fewest issues when none passes. generate(temperature, cancel) returns a completion
+        # and should stop once the `cancel` event is set; validate(text) returns its issues.
+        if len(self.temperatures) == 1:
+            text = generate(self.temperatures[0], None)
+            return text, validate(text)
+
+        cancel = threading.Event()
+        context = self.telemetry.context() if self.telemetry is not None else None
+
+        def run(temperature):
+            if context is None:
+                return generate(temperature, cancel)
+            with self.telemetry.joined(context):
+                return generate(temperature, cancel)
+
+        with self._lock:
+            self.runs += 1
+            self.candidates += len(self.temperatures)
+        pool = ThreadPoolExecutor(max_workers=len(self.temperatures))
+        with self._lock:
+            self._pools.append(pool)
+        futures = {pool.submit(run, t): rank for rank, t in enumerate(self.temperatures)}
+        results, errors = {}, {}
+        try:
+            for future in as_completed(futures):
+                rank = futures[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    errors[rank] = e
+                    continue
+                issues = validate(text)
+                if not issues:
+                    with self._lock:
+                        self.accepted[rank] += 1
+                    return text, issues
+                results[rank] = (text, issues)
+                with self._lock:
+                    self.rejected += 1
+        finally:
+            # the remaining candidates are not waited for; the ones not started yet still
+            # run, see the cancel event before sending and are recorded as cancelled
+            cancel.set()
+            pool.shutdown(wait=False)
+
+        with self._lock:
+            self.unresolved += 1
+        if not results:
+            raise errors[min(errors)]
+        return results[min(results, key=lambda rank: (len(results[rank][1]), rank))]
+
+    def join(self):
+        # wait for the candidates still running after their stage was decided, so their
+        # calls are in the telemetry before it is summarized
+        with self._lock:
+            pools, self._pools = self._pools, []
+        for pool in pools:
+            pool.shutdown(wait=True)
+
+    def summary(self):
+        accepted = ", ".join(f"{count} at T={t}" for t, count in zip(self.temperatures, self.accepted))
+        return (f"N-best: {self.runs} stages sent {self.candidates} candidates, accepted {accepted}; "
+                f"{self.rejected} candidates rejected, {self.unresolved} stages without a valid candidate")
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+from collections import deque
+from datetime import datetime
+
+from object_catalog import ai2thor_version, list_floor_plans
+
+
+# Shortest-path travel distances between the objects robots interact with, per floor plan.
+# Distances are measured on the GetReachablePositions grid (4-connected, the gridSize of
+# the executor), from the reachable position closest to each object, so they follow walls
+# and furniture instead of the straight line. Build them once with:
+#   python3 scripts/travel_costs.py --floor-plan all
+# and read them with load_travel_costs(floor_plan).
+
+TRAVEL_COSTS_VERSION = 1
+DEFAULT_TRAVEL_COSTS_DIR = "data/travel_costs"
+# gridSize of the agents in data/aithor_connect/aithor_connect.py
+GRID_SIZE = 0.5
+# objects a skill can act on, the others are never a GoToObject destination
+INTERACTION_FLAGS = ('pickupable', 'receptacle', 'openable', 'toggleable', 'sliceable', 'breakable', 'cookable')
+
+
+def grid_neighbours(positions, grid_size):
+    # adjacency of the reachable positions, keyed on the grid cell of each position
+    cells = {(round(x / grid_size), round(z / grid_size)): i for i, (x, z) in enumerate(positions)}
+    neighbours = [[] for _ in positions]
+    for (cx, cz), i in cells.items():
+        for dx, dz in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            j = cells.get((cx + dx, cz + dz))
+            if j is not None:
+                neighbours[i].append(j)
+    return neighbours
+
+
+def bfs_distances(start, neighbours, grid_size):
+    # distance in meters from `start` to every position, None where it cannot be reached
+    steps = [None] * len(neighbours)
+    steps[start] = 0
+    queue = deque([start])
+    while queue:
+        i = queue.popleft()
+        for j in neighbours[i]:
+            if steps[j] is None:
+                steps[j] = steps[i] + 1
+                queue.append(j)
+    return [None if s is None else round(s * grid_size, 2) for s in steps]
+
+
+def closest_position(point, positions):
+    x, z = point
+    return min(range(len(positions)), key=lambda i: (positions[i][0] - x) ** 2 + (positions[i][1] - z) ** 2)
+
+
+def compute_travel_costs(reachable_positions, objects, grid_size=GRID_SIZE):
+    # reachable_positions: GetReachablePositions output, objects: AI2-THOR object metadata
+    positions = [(p['x'], p['z']) for p in reachable_positions]
+    neighbours = grid_neighbours(positions, grid_size)
+    entries, distances = [], {}
+    for obj in objects:
+        if not any(obj.get(flag) for flag in INTERACTION_FLAGS):
+            continue
+        center = obj['axisAlignedBoundingBox']['center']
+        node = closest_position((center['x'], center['z']), positions)
+        entries.append({'objectId': obj['objectId'], 'objectType': obj['objectType'], 'node': node,
+                        'center': [center['x'], center['y'], center['z']]})
+        distances[obj['objectId']] = bfs_distances(node, neighbours, grid_size)
+    return {'version': TRAVEL_COSTS_VERSION, 'grid_size': grid_size, 'positions': positions,
+            'objects': entries, 'distances': distances}
+
+
+class TravelCosts:
+    def __init__(self, data):
+        self.grid_size = data['grid_size']
+        self.positions = [tuple(p) for p in data['positions']]
+        self.objects = data['objects']
+        self.distances = data['distances']
+
+    def object_entry(self, name):
+        # first object whose id starts with `name`, like GoToObject, skipping objects without a position
+        if name is None:
+            return None
+        matches = [o for o in self.objects if o['objectId'].startswith(name)]
+        placed = [o for o in matches if o['center'] != [0.0, 0.0, 0.0]]
+        return (placed or matches or [None])[0]
+
+    def distance(self, source, dest):
+        # travel distance in meters between two objects, None if unknown or unreachable
+        a, b = self.object_entry(source), self.object_entry(dest)
+        if a is None or b is None:
+            return None
+        return self.distances[a['objectId']][b['node']]
+
+    def distance_from(self, position, dest):
+        # travel distance from an (x, z) position, e.g. a robot pose, to an object
+        b = self.object_entry(dest)
+        if b is None:
+            return None
+        return self.distances[b['objectId']][closest_position(position, self.positions)]
+
+    def route_length(self, names):
+        # length of a GoToObject sequence, unknown legs count as 0
+        return sum(self.distance(a, b) or 0.0 for a, b in zip(names, names[1:]))
+
+    def matrix(self, names):
+        # {source: {dest: distance}} between the given object names
+        return {a: {b: self.distance(a, b) for b in names} for a in names}
+
+
+def travel_costs_path(floor_plan, root=DEFAULT_TRAVEL_COSTS_DIR):
+    return os.path.join(root, f"FloorPlan{floor_plan}.json")
+
+
+def load_travel_costs(floor_plan, root=DEFAULT_TRAVEL_COSTS_DIR):
+    # TravelCosts of a floor plan, None when it was not built or is from another format or simulator build
+    path = travel_costs_path(floor_plan, root)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r") as f:
+        data = json.load(f)
+    installed = ai2thor_version()
+    if data.get('version') != TRAVEL_COSTS_VERSION or \
+            (installed is not None and data.get('ai2thor_version') not in (None, installed)):
+        return None
+    return TravelCosts(data)
+
+
+def build_travel_costs(floor_plans, root=DEFAULT_TRAVEL_COSTS_DIR, grid_size=GRID_SIZE):
+    import ai2thor.controller
+
+    os.makedirs(root, exist_ok=True)
+    controller = ai2thor.controller.Controller(scene="FloorPlan" + str(floor_plans[0]), gridSize=grid_size)
+    try:
+        for floor_plan in floor_plans:
+            controller.reset("FloorPlan" + str(floor_plan))
+            reachable = controller.step(action="GetReachablePositions").metadata["actionReturn"]
+            data = compute_travel_costs(reachable, controller.last_event.metadata["objects"], grid_size)
+            data['ai2thor_version'] = ai2thor_version()
+            data['created'] = datetime.now().strftime("%m-%d-%Y-%H-%M-%S")
+            with open(travel_costs_path(floor_plan, root), 'w') as f:
+                json.dump(data, f)
+            print (f"FloorPlan{floor_plan}: {len(data['objects'])} objects over {len(data['positions'])} reachable positions")
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--floor-plan", type=str, nargs="+", required=True,
+                        help="Floor plan numbers, or 'all' for every floor plan in the test set")
+    parser.add_argument("--test-set", type=str, default="final_test")
+    parser.add_argument("--travel-costs-dir", type=str, default=DEFAULT_TRAVEL_COSTS_DIR)
+    parser.add_argument("--grid-size", type=float, default=GRID_SIZE)
+    args = parser.parse_args()
+
+    if "all" in args.floor_plan:
+        floor_plans = list_floor_plans(args.test_set)
+    else:
+        floor_plans = [int(v) for v in args.floor_plan]
+
+    build_travel_costs(floor_plans, args.travel_costs_dir, args.grid_size)
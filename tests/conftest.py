@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the scripts import each other as top-level modules, as when run from scripts/,
+# and the resources package from the repository root
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+sys.path.insert(1, ROOT)
@@ -0,0 +1,36 @@
+from checkpoints import CheckpointStore, inputs_key
+
+TASK = "Put the apple in the fridge"
+
+
+def test_stage_is_resumed_with_the_same_inputs(tmp_path):
+    key = inputs_key("decompose prompt", ["gpt-4"])
+    CheckpointStore(tmp_path).save(6, TASK, "gpt-4", "decompose", key, "plan")
+
+    store = CheckpointStore(tmp_path, resume=True)
+    assert store.load(6, TASK, "gpt-4", "decompose", key) == "plan"
+    assert store.resumed == 1
+
+
+def test_stage_is_not_resumed_when_its_inputs_changed(tmp_path):
+    CheckpointStore(tmp_path).save(6, TASK, "gpt-4", "decompose", inputs_key("old prompt"), "plan")
+
+    store = CheckpointStore(tmp_path, resume=True)
+    assert store.load(6, TASK, "gpt-4", "decompose", inputs_key("new prompt")) is None
+    assert store.load(6, TASK, "gpt-3.5-turbo", "decompose", inputs_key("old prompt")) is None
+
+
+def test_checkpoints_are_ignored_without_resume(tmp_path):
+    key = inputs_key("decompose prompt")
+    store = CheckpointStore(tmp_path)
+    store.save(6, TASK, "gpt-4", "decompose", key, "plan")
+    assert store.load(6, TASK, "gpt-4", "decompose", key) is None
+
+
+def test_invalid_output_is_not_resumed(tmp_path):
+    key = inputs_key("plan", "solution", "code")
+    CheckpointStore(tmp_path).save(6, TASK, "gpt-4", "logs", key, "missing_folder")
+
+    store = CheckpointStore(tmp_path, resume=True)
+    assert store.load(6, TASK, "gpt-4", "logs", key, valid=lambda folder: False) is None
+    assert store.resumed == 0
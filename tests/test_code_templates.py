@@ -0,0 +1,67 @@
+import resources.actions as actions
+from allocation_solver import solve_allocation
+from code_templates import generate_allocated_code
+from plan_validator import validate_plan
+
+TASK = "Wash the fork and put the pot on the stove"
+
+PLAN = """# GENERAL TASK DECOMPOSITION
+# Independent subtasks:
+# SubTask 1: Wash the Fork. (Skills Required: GoToObject, PickupObject, PutObject, SwitchOn, SwitchOff)
+# SubTask 2: Put the Pot on the StoveBurner. (Skills Required: GoToObject, PickupObject, PutObject)
+# We can perform SubTask 1 and SubTask 2 in parallel.
+
+# CODE
+def wash_fork():
+    # 0: SubTask 1: Wash the Fork
+    GoToObject('Fork')
+    PickupObject('Fork')
+    GoToObject('Sink')
+    PutObject('Fork', 'Sink')
+    SwitchOn('Faucet')
+    time.sleep(5)
+    SwitchOff('Faucet')
+
+def put_pot_on_stove():
+    # 0: SubTask 2: Put the Pot on the StoveBurner
+    GoToObject('Pot')
+    PickupObject('Pot')
+    GoToObject('StoveBurner')
+    PutObject('Pot', 'StoveBurner')
+
+# Parallelize SubTask 1 and SubTask 2
+task1_thread = threading.Thread(target=wash_fork)
+task2_thread = threading.Thread(target=put_pot_on_stove)
+task1_thread.start()
+task2_thread.start()
+task1_thread.join()
+task2_thread.join()
+"""
+
+ROBOTS = [
+    {'name': 'robot1', 'skills': ['GoToObject', 'SwitchOn', 'SwitchOff'], 'mass': 1},
+    {'name': 'robot2', 'skills': ['GoToObject', 'PickupObject', 'PutObject'], 'mass': 1},
+    {'name': 'robot3', 'skills': ['GoToObject', 'PickupObject', 'PutObject'], 'mass': 1},
+    {'name': 'robot4', 'skills': ['GoToObject', 'PickupObject', 'PutObject'], 'mass': 1},
+]
+
+OBJECTS = [{'name': name, 'mass': mass} for name, mass in
+           [('Fork', 0.5), ('Sink', 50), ('Faucet', 5), ('Pot', 1.5), ('StoveBurner', 10)]]
+
+
+def test_solver_forms_teams_for_missing_skills_and_mass():
+    allocation = solve_allocation(PLAN, ROBOTS, OBJECTS, actions.ai2thor_skills)
+    # the fork needs a robot for the faucet, the pot is too heavy for one robot
+    assert allocation.teams == {'wash_fork': (0, 1), 'put_pot_on_stove': (2, 3)}
+    text = allocation.text()
+    assert "The subtask is assigned to team of Robots 1 and 2." in text
+    assert "# put_pot_on_stove and wash_fork are performed in parallel by different robots." in text
+
+
+def test_templated_code_is_valid():
+    allocation = solve_allocation(PLAN, ROBOTS, OBJECTS, actions.ai2thor_skills)
+    code = generate_allocated_code(PLAN, allocation, ROBOTS, OBJECTS, actions.ai2thor_skills, TASK)
+    assert "SwitchOn(robot_list[0], 'Faucet')" in code
+    assert "PickupObject(robot_list, 'Pot')" in code
+    assert "threading.Thread(target=put_pot_on_stove, args=([robots[2], robots[3]],))" in code
+    assert validate_plan(code, ROBOTS, [o['name'] for o in OBJECTS], actions.ai2thor_skills, (), TASK) == []
@@ -0,0 +1,84 @@
+import json
+import os
+
+from llm_cache import LLMCache, request_key
+
+
+def cached_generate(cache, key, llm, bypass=False):
+    # the response cache as LM() uses it: (text, keys of the responses it came from)
+    with cache.tracking(bypass) as keys:
+        entry = cache.get(key)
+        if entry is None:
+            entry = {"text": llm()}
+            cache.put(key, entry)
+    return entry["text"], keys
+
+
+def test_rejected_cached_plan_is_not_replayed(tmp_path):
+    cache = LLMCache(tmp_path)
+    key = request_key("gpt-4", "write the plan", 1000, 0, 0.4, None)
+    replies = iter(["bad plan", "good plan"])
+
+    text, keys = cached_generate(cache, key, lambda: next(replies))
+    assert text == "bad plan"
+    # the validator rejects the plan
+    cache.discard(keys)
+
+    text, _ = cached_generate(cache, key, lambda: next(replies))
+    assert text == "good plan"
+    assert cache.discarded == 1
+    assert cache.hits == 0
+
+
+def test_bypass_asks_the_llm_and_stores_the_response(tmp_path):
+    cache = LLMCache(tmp_path)
+    key = request_key("gpt-4", "write the plan", 1000, 0, 0.4, None)
+    cached_generate(cache, key, lambda: "first plan")
+
+    text, keys = cached_generate(cache, key, lambda: "regenerated plan", bypass=True)
+    assert text == "regenerated plan"
+    assert keys == [key]
+    assert cache.bypassed == 1
+
+    text, _ = cached_generate(cache, key, lambda: "unused")
+    assert text == "regenerated plan"
+
+
+def test_nested_scopes_report_their_keys_to_the_outer_scope(tmp_path):
+    cache = LLMCache(tmp_path)
+    with cache.tracking(bypass=True) as outer:
+        with cache.tracking() as inner:
+            assert cache.get("ab" * 32) is None
+            cache.put("ab" * 32, {"text": "plan"})
+    assert inner == outer == ["ab" * 32]
+    assert cache.bypassed == 1
+
+
+def test_request_key_covers_every_request_parameter():
+    base = dict(model="gpt-4", prompt=[{"role": "user", "content": "plan"}], max_tokens=1000,
+                temperature=0, frequency_penalty=0.4, stop=None)
+    key = request_key(**base)
+    assert request_key(**base) == key
+    for name, value in [("model", "gpt-3.5-turbo"), ("prompt", "plan"), ("max_tokens", 1300),
+                        ("temperature", 0.3), ("frequency_penalty", 0.0), ("stop", ["def"])]:
+        assert request_key(**dict(base, **{name: value})) != key, name
+    # message dicts are keyed on their content, not on the order of their keys
+    reordered = dict(base, prompt=[{"content": "plan", "role": "user"}])
+    assert request_key(**reordered) == key
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    entry = {"text": "x" * 100}
+    cache = LLMCache(tmp_path, max_bytes=2 * len(json.dumps(entry)) + 10)
+    cache.put("aa" * 32, entry)
+    cache.put("bb" * 32, entry)
+    os.utime(cache._path("aa" * 32), (1000, 1000))
+    os.utime(cache._path("bb" * 32), (2000, 2000))
+    # reading the older entry makes it the most recently used one
+    assert cache.get("aa" * 32) == entry
+
+    cache.put("cc" * 32, entry)
+    assert cache.evictions == 1
+    assert cache.get("bb" * 32) is None
+    assert cache.get("aa" * 32) == entry
+    assert cache.get("cc" * 32) == entry
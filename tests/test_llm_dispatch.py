@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+
+from llm_dispatch import ConcurrencyLimit
+
+
+class Cancelled(Exception):
+    pass
+
+
+def test_requests_in_flight_are_capped():
+    limit = ConcurrencyLimit(2)
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def request():
+        limit.acquire()
+        try:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+        finally:
+            limit.release()
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] == 2
+    assert limit.held >= 1
+
+
+def test_waiting_request_gives_up_when_cancelled():
+    limit = ConcurrencyLimit(1)
+    limit.acquire()
+    cancel = threading.Event()
+
+    def check():
+        if cancel.is_set():
+            raise Cancelled()
+
+    threading.Timer(0.05, cancel.set).start()
+    with pytest.raises(Cancelled):
+        limit.acquire(check, poll=0.01)
+    limit.release()
+    assert limit.acquire() == 0.0
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from llm_retry import CircuitBreaker
+
+
+def fail_together(breaker, n):
+    # n calls started while the breaker is closed, all failing once every one is in flight
+    tokens = []
+    started = threading.Barrier(n)
+
+    def call():
+        token = breaker.wait()
+        tokens.append(token)
+        started.wait()
+        breaker.record(False, token)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return tokens
+
+
+def test_in_flight_failures_trip_once():
+    breaker = CircuitBreaker(min_calls=5, cooldown=0.2)
+    fail_together(breaker, 8)
+    assert breaker.trips == 1
+    assert breaker.state == 'open'
+    assert breaker.cooldown == 0.2
+
+
+def test_failures_started_before_the_trip_are_ignored():
+    breaker = CircuitBreaker(min_calls=5, cooldown=0.2)
+    late = [breaker.wait() for _ in range(3)]
+    fail_together(breaker, 5)
+    for token in late:
+        breaker.record(False, token)
+    assert breaker.trips == 1
+    assert breaker.probes == 0
+
+
+def test_probe_success_closes_the_breaker():
+    breaker = CircuitBreaker(min_calls=5, cooldown=0.2)
+    fail_together(breaker, 5)
+    start = time.monotonic()
+    token = breaker.wait()
+    assert time.monotonic() - start >= 0.15
+    assert token[1] and breaker.state == 'half-open'
+    breaker.record(True, token)
+    assert breaker.state == 'closed'
+    assert breaker.trips == 1 and breaker.probes == 1
+    assert 0.15 <= breaker.open_time < 0.5
+
+
+def test_probe_failure_doubles_the_cooldown():
+    breaker = CircuitBreaker(min_calls=5, cooldown=0.1)
+    fail_together(breaker, 5)
+    breaker.record(False, breaker.wait())
+    assert breaker.trips == 2
+    assert breaker.cooldown == 0.2
+    breaker.record(True, breaker.wait())
+    assert breaker.state == 'closed' and breaker.cooldown == 0.1
+    assert 0.25 <= breaker.open_time < 0.6
+
+
+def test_one_probe_at_a_time():
+    breaker = CircuitBreaker(min_calls=5, cooldown=0.1)
+    fail_together(breaker, 5)
+    probe = breaker.wait()
+    waiting = []
+    others = [threading.Thread(target=lambda: waiting.append(breaker.wait())) for _ in range(4)]
+    for t in others:
+        t.start()
+    time.sleep(0.1)
+    assert waiting == []
+    breaker.record(True, probe)
+    for t in others:
+        t.join()
+    assert len(waiting) == 4 and not any(probe for _, probe in waiting)
+    assert breaker.probes == 1
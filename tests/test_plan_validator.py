@@ -0,0 +1,51 @@
+import ast
+import os
+import re
+
+import resources.actions as actions
+from example_retrieval import example_function_names, parse_examples
+from plan_validator import validate_plan
+
+CODE_EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             "data", "pythonic_plans", "train_task_allocation_code.py")
+
+
+def training_examples():
+    # (task, robots, code solution, object names) of every allocation code example
+    with open(CODE_EXAMPLES) as f:
+        text = f.read()
+    _, examples = parse_examples(text)
+    for example in examples:
+        robots = ast.literal_eval(re.search(r"^robots = (\[.*\])$", example['text'], re.MULTILINE).group(1))
+        code = re.split(r"# Code Solution", example['text'], flags=re.IGNORECASE)[1]
+        objects = set(re.findall(r"'([A-Z]\w*)'", code))
+        yield example['task'], robots, code, objects
+
+
+def example_functions():
+    with open(CODE_EXAMPLES) as f:
+        return example_function_names(f.read())
+
+
+def test_training_examples_are_valid():
+    for task, robots, code, objects in training_examples():
+        assert validate_plan(code, robots, objects, actions.ai2thor_skills, example_functions(), task) == [], task
+
+
+def test_robot_index_out_of_range():
+    task, robots, code, objects = next(training_examples())
+    issues = validate_plan(code, robots[:1], objects, actions.ai2thor_skills, example_functions(), task)
+    assert issues == ["robots[1] is out of range, there are 1 robots"]
+
+
+def test_object_missing_from_the_floor_plan():
+    task, robots, code, objects = next(training_examples())
+    issues = validate_plan(code, robots, objects - {'Faucet'}, actions.ai2thor_skills, example_functions(), task)
+    assert issues == ["SwitchOn() uses object 'Faucet' which is not in the floor plan",
+                      "SwitchOff() uses object 'Faucet' which is not in the floor plan"]
+
+
+def test_copied_example_function():
+    _, robots, code, objects = next(training_examples())
+    issues = validate_plan(code, robots, objects, actions.ai2thor_skills, example_functions(), "Slice the apple")
+    assert issues == ["copied training example function wash_fork()"]
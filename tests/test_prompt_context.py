@@ -0,0 +1,46 @@
+import glob
+import json
+import os
+
+from prompt_context import relevant_objects
+
+TEST_SET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "final_test")
+
+
+def final_test_tasks():
+    for path in sorted(glob.glob(os.path.join(TEST_SET, "FloorPlan*.json"))):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def ground_truth_objects(task):
+    # object types, without the stray spaces and commas of some entries ("CellPhone ", "CoffeeTable,")
+    names = set()
+    for state in task['object_states']:
+        names.add(state['name'].strip(' ,'))
+        names.update(name.strip(' ,') for name in state['contains'])
+    return names
+
+
+def test_relevant_context_keeps_ground_truth_objects():
+    # every object a final_test task is checked against survives --object-context relevant
+    missing = {}
+    for task in final_test_tasks():
+        names = ground_truth_objects(task)
+        objects = [{'name': name, 'mass': 1.0} for name in sorted(names)]
+        kept = {o['name'] for o in relevant_objects(objects, task['task'])}
+        if names - kept:
+            missing[task['task']] = sorted(names - kept)
+    assert missing == {}
+
+
+def test_compound_names_need_more_than_a_generic_head_word():
+    objects = [{'name': name, 'mass': 1.0} for name in
+               ['ButterKnife', 'StoveKnob', 'CounterTop', 'TableTopDecor', 'SideTable', 'CellPhone']]
+    kept = {o['name'] for o in relevant_objects(objects, "Put the knob on top of the side table")}
+    # CounterTop is a common receptacle, every compound word of SideTable is in the task
+    assert kept == {'CounterTop', 'SideTable'}
+    kept = {o['name'] for o in relevant_objects(objects, "Slice the bread with a knife")}
+    assert kept == {'ButterKnife', 'CounterTop'}
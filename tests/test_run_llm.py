@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_llm(cwd, *args):
+    # run_llm.py reads data/ and resources/ and writes logs/ relative to the working directory
+    result = subprocess.run([sys.executable, "scripts/run_llm.py", *args], cwd=cwd,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
+    return result.stdout
+
+
+def test_synthetic_floor_plan_without_catalog(tmp_path):
+    for name in ("data", "resources", "scripts"):
+        os.symlink(os.path.join(ROOT, name), tmp_path / name)
+    args = ["--floor-plan", "6", "--backend", "synthetic", "--object-catalog", str(tmp_path / "catalog.json")]
+
+    out = run_llm(tmp_path, *args)
+    assert "the objects of floor plans [6] are taken from the ground truth of their tasks" in out
+    assert "Generated 3/3 tasks" in out
+    folders = [d for d in os.listdir(tmp_path / "logs") if not d.startswith(".")]
+    assert len(folders) == 3
+    for folder in folders:
+        for name in ("code_plan.py", "log.txt", "telemetry.jsonl"):
+            assert os.path.isfile(tmp_path / "logs" / folder / name), name
+
+    # every stage of the three tasks is read back, no folder is written again
+    out = run_llm(tmp_path, *args, "--resume")
+    assert "Generated 3/3 tasks" in out
+    assert "Checkpoints: 12 stages resumed, 0 saved" in out
+    assert len([d for d in os.listdir(tmp_path / "logs") if not d.startswith(".")]) == 3
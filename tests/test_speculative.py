@@ -0,0 +1,32 @@
+import threading
+import time
+
+from speculative import Speculator
+
+
+def test_every_candidate_runs_and_losers_see_the_cancel_event():
+    speculator = Speculator(n=3)
+    seen = {}
+    lock = threading.Lock()
+
+    def generate(temperature, cancel):
+        if temperature > 0:
+            time.sleep(0.05)
+        with lock:
+            seen[temperature] = cancel.is_set()
+        return f"plan at {temperature}"
+
+    text, issues = speculator.first_valid(generate, lambda text: [])
+    assert (text, issues) == ("plan at 0.0", [])
+    speculator.join()
+    # the other candidates are not dropped, they run (and are recorded) as cancelled
+    assert seen == {0.0: False, 0.3: True, 0.6: True}
+    assert speculator.accepted == [1, 0, 0]
+
+
+def test_candidate_with_fewest_issues_when_none_passes():
+    speculator = Speculator(n=2)
+    text, issues = speculator.first_valid(lambda temperature, cancel: str(temperature),
+                                          lambda text: ["bad"] if text == "0.0" else ["bad", "worse"])
+    assert (text, issues) == ("0.0", ["bad"])
+    assert speculator.unresolved == 1